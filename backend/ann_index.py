@@ -0,0 +1,208 @@
+"""
+Approximate nearest-neighbor search over latent factor vectors.
+
+The index is a pure-NumPy inverted file (IVF): vectors are clustered with
+k-means at build time and a query only scans the n_probe clusters whose
+centroids score highest against it. Scores are inner products, so on
+L2-normalized vectors they are cosine similarities and on raw factors the
+index performs maximum-inner-product search.
+"""
+import time
+import numpy as np
+from ranking import top_k
+
+class IVFIndex:
+    """Inverted-file approximate nearest-neighbor index using inner product scores"""
+
+    def __init__(self, n_lists=None, n_probe=8, n_iter=10, seed=0):
+        """
+        Initialize the index
+
+        Parameters:
+        -----------
+        n_lists : int, optional
+            Number of k-means clusters (inverted lists). Defaults to
+            sqrt(n_vectors) at build time.
+        n_probe : int
+            Number of lists scanned per query. This is the recall/latency
+            knob: n_probe == n_lists is an exact search, smaller values scan
+            proportionally fewer vectors. It can be changed after build.
+        n_iter : int
+            Number of k-means iterations used to train the centroids
+        seed : int
+            Random seed for centroid initialization and training sample
+        """
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.seed = seed
+        self.centroids = None
+        self.list_offsets = None
+        self.list_ids = None
+        self.list_vectors = None
+
+    def build(self, vectors):
+        """
+        Cluster the vectors and build the inverted lists
+
+        Parameters:
+        -----------
+        vectors : numpy.ndarray
+            Matrix of shape (n_vectors, dim) to index
+
+        Returns:
+        --------
+        self
+        """
+        vectors = np.asarray(vectors)
+        n_vectors = vectors.shape[0]
+        n_lists = self.n_lists or int(np.sqrt(n_vectors))
+        n_lists = max(1, min(n_lists, n_vectors))
+
+        self.centroids = _train_kmeans(vectors, n_lists, self.n_iter, self.seed)
+
+        # Group vector ids by cluster so each list is a contiguous slice
+        assignments = _assign(vectors, self.centroids)
+        order = np.argsort(assignments, kind='stable')
+        counts = np.bincount(assignments, minlength=n_lists)
+
+        self.n_lists = n_lists
+        self.list_offsets = np.concatenate([[0], np.cumsum(counts)])
+        self.list_ids = order.astype(np.int64)
+        self.list_vectors = np.ascontiguousarray(vectors[order])
+
+        return self
+
+    def search(self, query, k, exclude=None):
+        """
+        Find the vectors with the highest inner product against the query
+
+        Parameters:
+        -----------
+        query : numpy.ndarray
+            Query vector of shape (dim,)
+        k : int
+            Number of results to return
+        exclude : array-like of int, optional
+            Vector ids that must not be returned
+
+        Returns:
+        --------
+        tuple
+            (ids, scores) arrays sorted by descending score. Fewer than k
+            results are returned when the probed lists are too small.
+        """
+        # Pick the lists whose centroids score highest against the query
+        n_probe = max(1, min(self.n_probe, self.n_lists))
+        centroid_scores = np.dot(self.centroids, query)
+        probe = top_k(centroid_scores, n_probe)
+
+        # Score every vector in the probed lists
+        ranges = [np.arange(self.list_offsets[c], self.list_offsets[c + 1]) for c in probe]
+        positions = np.concatenate(ranges)
+        ids = self.list_ids[positions]
+        scores = np.dot(self.list_vectors[positions], query)
+
+        if exclude is not None and len(exclude) > 0:
+            keep = ~np.isin(ids, exclude)
+            ids = ids[keep]
+            scores = scores[keep]
+
+        # Get top k candidates
+        top = top_k(scores, k)
+        return ids[top], scores[top]
+
+def _assign(vectors, centroids, block_size=65536):
+    """Assign each vector to its nearest centroid (squared L2 distance)"""
+    half_norms = 0.5 * np.sum(centroids ** 2, axis=1)
+    assignments = np.empty(vectors.shape[0], dtype=np.int64)
+
+    # argmin ||x - c||^2 == argmax (x.c - ||c||^2 / 2), computed in blocks
+    for start in range(0, vectors.shape[0], block_size):
+        block = vectors[start:start + block_size]
+        assignments[start:start + block_size] = np.argmax(np.dot(block, centroids.T) - half_norms, axis=1)
+
+    return assignments
+
+def _train_kmeans(vectors, n_lists, n_iter, seed, sample_per_list=256):
+    """Train k-means centroids on a random sample of the vectors"""
+    rng = np.random.default_rng(seed)
+
+    # Train on a bounded sample; the full set is only needed for assignment
+    n_sample = min(vectors.shape[0], n_lists * sample_per_list)
+    sample = vectors[rng.choice(vectors.shape[0], n_sample, replace=False)]
+
+    centroids = sample[rng.choice(n_sample, n_lists, replace=False)].copy()
+    for _ in range(n_iter):
+        assignments = _assign(sample, centroids)
+        counts = np.bincount(assignments, minlength=n_lists)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+
+        # Keep the previous centroid for clusters that lost all their points
+        nonempty = counts > 0
+        centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+
+    return centroids
+
+def recall_at_k(index, vectors, queries=None, k=10, n_queries=100, seed=0):
+    """
+    Measure an index's recall@k and latency against exact search
+
+    Parameters:
+    -----------
+    index : object
+        Built index with a search(query, k, exclude) method
+    vectors : numpy.ndarray
+        The indexed vectors, scored exhaustively for the exact results
+    queries : numpy.ndarray, optional
+        Query vectors. Defaults to the indexed vectors themselves, in which
+        case each query's own id is excluded from both result sets.
+    k : int
+        Number of neighbors compared per query
+    n_queries : int
+        Number of randomly chosen queries
+    seed : int
+        Random seed for choosing the queries
+
+    Returns:
+    --------
+    dict
+        recall@k and mean/p99 query latency in milliseconds for both paths
+    """
+    exclude_self = queries is None
+    if exclude_self:
+        queries = vectors
+
+    rng = np.random.default_rng(seed)
+    chosen = rng.choice(queries.shape[0], min(n_queries, queries.shape[0]), replace=False)
+
+    recalls = []
+    exact_times = []
+    approx_times = []
+    for q in chosen:
+        exclude = [q] if exclude_self else None
+
+        start = time.perf_counter()
+        scores = np.dot(vectors, queries[q])
+        if exclude_self:
+            scores[q] = -np.inf
+        exact = top_k(scores, k)
+        exact = exact[np.isfinite(scores[exact])]
+        exact_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        approx, _ = index.search(queries[q], k, exclude=exclude)
+        approx_times.append(time.perf_counter() - start)
+
+        recalls.append(len(np.intersect1d(exact, approx)) / max(1, len(exact)))
+
+    return {
+        'k': k,
+        'n_queries': len(chosen),
+        'recall': float(np.mean(recalls)),
+        'exact_ms_mean': 1000 * float(np.mean(exact_times)),
+        'exact_ms_p99': 1000 * float(np.percentile(exact_times, 99)),
+        'approx_ms_mean': 1000 * float(np.mean(approx_times)),
+        'approx_ms_p99': 1000 * float(np.percentile(approx_times, 99)),
+    }
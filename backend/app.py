@@ -1,25 +1,273 @@
 """
 Flask API for recommendation system and sentiment analysis.
 """
-from flask import Flask, jsonify, request
-from flask_cors import CORS
 import os
+import sys
+
+if __name__ == '__main__':
+    # `python app.py` (start.sh) serves through run.py rather than running
+    # this module as __main__: multiprocessing children (the chart
+    # renderers) re-import the main script, and importing this module
+    # starts the whole app, while importing run.py does not
+    import runpy
+    runpy.run_module('run', run_name='__main__', alter_sys=True)
+    sys.exit()
+
+from flask import Flask, Response, g, jsonify, redirect, request, send_file, url_for
+from flask_cors import CORS
 import json
+import time
+import atexit
 import numpy as np
-from data import users, items, ratings, save_to_json
-from collaborative_filtering import CollaborativeFilteringRecommender, train_recommender, get_item_info, get_user_info
-from sentiment_analysis import analyze_item_reviews
-import matplotlib.pyplot as plt
-import seaborn as sns
-import base64
-from io import BytesIO
+from functools import partial
+from ann_index import IVFIndex
+from model_store import ArtifactWatcher, ModelStore, TrainerLock, snapshot_version
+from ratings_log import RatingsLog, RatingsLogTailer, validate_rating
+from data import users, items, ratings, store
+from collaborative_filtering import (CollaborativeFilteringRecommender, train_recommender, current_model_path,
+                                     publish_model, get_item_info, get_user_info)
+from sentiment_charts import chart_cache
+import metrics
+from profiling import RequestProfiler
+from response_cache import ResponseCache
 
 app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
-
-# Initialize the recommendation model
-model = train_recommender()
-print(f"Recommendation model trained. Rating matrix shape: {model.rating_matrix.shape}")
+CORS(app, expose_headers=['ETag', 'X-Profile-Id', 'X-Profile-Url'])  # Enable CORS for all routes
+
+# Request latency per route, exposed on /metrics when METRICS_ENABLED=1
+REQUEST_SECONDS = metrics.histogram('http_request_duration_seconds', "Request latency by route, method and status",
+                                    ['route', 'method', 'status'])
+
+if metrics.ENABLED:
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def observe_request_latency(response):
+        # Label by the URL rule, not the path, to keep one series per route
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_start,
+                                (route, request.method, str(response.status_code)))
+        return response
+
+# Set by gunicorn.conf.py when the app is imported once in the master
+# process and then forked into the workers
+PRELOADED_WORKERS = os.environ.get('PRELOADED_WORKERS') == '1'
+
+# Opt-in per-request profiling. With PROFILING_ENABLED=1, a request sent with
+# the X-Profile: 1 header or ?profile=1 runs under cProfile, at most
+# PROFILE_RATE_LIMIT times per minute per worker. The response carries the
+# stored profile's ID and download URL. When PROFILE_TOKEN is set, the flag
+# must equal it, for triggering profiles and for downloading them
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED') == '1'
+profiler = None
+if PROFILING_ENABLED:
+    profiler = RequestProfiler(os.environ.get('PROFILE_DIR', 'profiles'),
+                               max_per_minute=int(os.environ.get('PROFILE_RATE_LIMIT', 6)),
+                               max_profiles=int(os.environ.get('PROFILE_KEEP', 100)),
+                               token=os.environ.get('PROFILE_TOKEN'))
+
+    def _profile_flag():
+        """Return the request's profiling flag (X-Profile header or ?profile=)"""
+        return request.headers.get('X-Profile') or request.args.get('profile')
+
+    @app.before_request
+    def start_profile():
+        if request.endpoint in ('list_profiles', 'get_profile') or not profiler.requested(_profile_flag()):
+            return
+        g.profile = profiler.start()
+        g.profile_start = time.perf_counter()
+
+    @app.after_request
+    def save_profile(response):
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profile_id = profiler.finish(profile, {
+                'method': request.method,
+                'path': request.full_path.rstrip('?'),
+                'route': request.url_rule.rule if request.url_rule is not None else None,
+                'status': response.status_code,
+                'duration_ms': 1000 * (time.perf_counter() - g.profile_start)
+            })
+            response.headers['X-Profile-Id'] = profile_id
+            response.headers['X-Profile-Url'] = url_for('get_profile', profile_id=profile_id, _external=True)
+        return response
+
+    @app.teardown_request
+    def stop_profile(exc):
+        # after_request is skipped when a handler raises
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profiler.stop(profile)
+
+# Load persisted ratings: the ratings.json snapshot (or the sample data) plus
+# the append-only log of ratings posted since the last compaction.
+# RATINGS_COMPACT_EVERY=0 disables compaction while serving, which is
+# required when several worker processes append to the same log; the log
+# is then compacted at startup, before the workers are forked
+RATINGS_COMPACT_EVERY = int(os.environ.get('RATINGS_COMPACT_EVERY', 10000))
+ratings_log = RatingsLog('data', default=ratings, compact_every=RATINGS_COMPACT_EVERY)
+if not RATINGS_COMPACT_EVERY and ratings_log.log_records:
+    ratings_log.compact()
+stored_ratings, ratings_log_offset = ratings_log.replay()
+store.load_ratings(stored_ratings)
+atexit.register(ratings_log.close)
+
+# Sentiment analysis pulls in NLTK, so it is imported by the endpoints that
+# use it rather than at startup; the recommendation path never loads it
+def _loaded_sentiment_module():
+    """Return the sentiment_analysis module if it has been imported, else None"""
+    return sys.modules.get('sentiment_analysis')
+
+@atexit.register
+def _save_review_cache():
+    """Persist the review sentiment cache if sentiment analysis was used"""
+    sentiment = _loaded_sentiment_module()
+    if sentiment is not None:
+        sentiment.review_cache.save()
+
+# Optionally load the sentiment analyzer's NLTK resources before serving
+if os.environ.get('WARM_SENTIMENT') == '1':
+    from sentiment_analysis import get_analyzer
+    get_analyzer()
+
+# Approximate nearest-neighbor search. ANN_N_PROBE > 0 enables the IVF index
+# and sets how many inverted lists each query scans: higher values raise
+# recall at the cost of latency. ANN_N_LISTS overrides the number of lists.
+ANN_N_PROBE = int(os.environ.get('ANN_N_PROBE', 0))
+ANN_N_LISTS = int(os.environ.get('ANN_N_LISTS', 0)) or None
+index_factory = partial(IVFIndex, n_lists=ANN_N_LISTS, n_probe=ANN_N_PROBE) if ANN_N_PROBE > 0 else None
+
+# Depth of the per-user top recommendation table precomputed at every fit.
+# Requests for up to TOP_N_DEPTH recommendations are served from it; deeper
+# requests and users who rated items since the fit are scored live. 0
+# disables the table.
+TOP_N_DEPTH = int(os.environ.get('TOP_N_DEPTH', 0))
+
+# Initialize the recommendation model. When MODEL_DIR holds a published
+# artifact (see export_model.py) it is memory-mapped instead of retrained.
+# New ratings are folded into the model immediately; after REFIT_THRESHOLD
+# of them the background trainer refits it REFIT_DEBOUNCE seconds after the
+# last write (at most REFIT_MAX_DELAY seconds after the first) and swaps
+# the new version in
+MODEL_DIR = os.environ.get('MODEL_DIR', 'models')
+REFIT_THRESHOLD = int(os.environ.get('REFIT_THRESHOLD', 100))
+REFIT_DEBOUNCE = float(os.environ.get('REFIT_DEBOUNCE', 2.0))
+REFIT_MAX_DELAY = float(os.environ.get('REFIT_MAX_DELAY', 30.0))
+
+# Reload the model when a new artifact is published to MODEL_DIR, checking
+# every MODEL_WATCH_INTERVAL seconds (0 disables). Ratings stored after the
+# artifact was exported are replayed from the ratings log, which every
+# worker appends to, and folded in before the new model is swapped in
+MODEL_WATCH_INTERVAL = float(os.environ.get('MODEL_WATCH_INTERVAL', 5.0))
+
+# Preforked workers elect a single trainer through a lock file in
+# MODEL_DIR instead of each refitting its own copy. The trainer publishes
+# every refit to MODEL_DIR, and all workers (itself included) reload it
+# from there. Without the artifact watcher every worker refits itself
+SHARED_TRAINER = PRELOADED_WORKERS and MODEL_WATCH_INTERVAL > 0
+
+def publish_and_reload(model):
+    """Publish a model refitted by this worker, then install it from the artifact like the other workers"""
+    publish_model(model, MODEL_DIR)
+    return artifact_watcher.check()
+
+trainer_lock = None
+if SHARED_TRAINER:
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    trainer_lock = TrainerLock(os.path.join(MODEL_DIR, 'trainer.lock'))
+
+model_store = ModelStore(partial(train_recommender, index_factory=index_factory,
+                                 n_top_recommendations=TOP_N_DEPTH), ratings,
+                         refit_threshold=REFIT_THRESHOLD, debounce_seconds=REFIT_DEBOUNCE,
+                         max_delay_seconds=REFIT_MAX_DELAY,
+                         publish_fn=publish_and_reload if SHARED_TRAINER else None,
+                         trainer_lock=trainer_lock)
+
+artifact_path = current_model_path(MODEL_DIR)
+if artifact_path:
+    model_store.start(CollaborativeFilteringRecommender.load(artifact_path, index_factory=index_factory),
+                      start_trainer=False)
+    print(f"Recommendation model loaded from {artifact_path}")
+else:
+    model_store.start(start_trainer=False)
+
+# Installs the artifacts published to MODEL_DIR (see MODEL_WATCH_INTERVAL)
+artifact_watcher = ArtifactWatcher(model_store, partial(current_model_path, MODEL_DIR),
+                                   partial(CollaborativeFilteringRecommender.load, index_factory=index_factory),
+                                   load_ratings=ratings_log.load, interval=MODEL_WATCH_INTERVAL,
+                                   path=artifact_path)
+
+def start_background_threads():
+    """
+    Start the background trainer and artifact watcher in this process
+
+    Threads do not survive fork(), so with a preloaded app this is called in
+    every worker after it is forked (see gunicorn.conf.py). Only the worker
+    elected through the trainer lock starts the trainer.
+    """
+    model_store.start_trainer()
+    if MODEL_WATCH_INTERVAL > 0:
+        artifact_watcher.start()
+
+if not PRELOADED_WORKERS:
+    start_background_threads()
+
+def apply_rating(rating):
+    """
+    Add a stored rating to the data store, the sentiment aggregates and the model
+
+    Returns:
+    --------
+    ModelSnapshot
+        The snapshot that includes the rating
+    """
+    store.add_rating(rating)
+
+    # Fold the review into the item's running sentiment aggregate. Before
+    # sentiment analysis is first used there are no aggregates to update
+    sentiment = _loaded_sentiment_module()
+    if sentiment is not None:
+        sentiment.update_item_sentiment(rating['itemId'])
+
+    # Fold the rating into the model, refitting fully once enough accumulate
+    return model_store.add_rating(rating)
+
+# Preforked workers each hold their own store, sentiment aggregates and
+# model, so ratings are applied from the shared ratings log rather than by
+# the worker that received them: every worker tails the log before each
+# request and thereby sees (and trains on) the ratings posted to any worker
+ratings_tailer = None
+if PRELOADED_WORKERS:
+    ratings_tailer = RatingsLogTailer(ratings_log.log_path, ratings_log_offset, apply_rating)
+
+    @app.before_request
+    def _apply_shared_ratings():
+        ratings_tailer.poll()
+
+# Largest number of userIds accepted by one batch recommendation request
+MAX_BATCH_USERS = int(os.environ.get('MAX_BATCH_USERS', 1000))
+
+# Serialized recommendation and similarity responses are cached per model
+# version (RESPONSE_CACHE_SIZE entries, 0 disables; RESPONSE_CACHE_TTL
+# seconds at most) and revalidated by clients with ETags
+response_cache = ResponseCache(max_size=int(os.environ.get('RESPONSE_CACHE_SIZE', 10000)),
+                               ttl=float(os.environ.get('RESPONSE_CACHE_TTL', 300)))
+
+def cached_json_response(entry):
+    """Build a JSON response from a response cache entry, answering a matching If-None-Match with 304"""
+    response = Response(entry.body, mimetype='application/json')
+    response.set_etag(entry.etag)
+    # Clients and CDNs may store the response but must revalidate it, since
+    # the model can change with any new rating
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+print(f"Recommendation model ready. Rating matrix shape: {model_store.current.model.rating_matrix.shape}")
+for search, report in model_store.current.model.evaluate_ann_recall().items():
+    print(f"ANN {search}: recall@{report['k']}={report['recall']:.3f}, "
+          f"p99 {report['approx_ms_p99']:.2f}ms (exact {report['exact_ms_p99']:.2f}ms)")
 
 @app.route('/', methods=['GET'])
 def index():
@@ -27,14 +275,19 @@ def index():
     return jsonify({
         "message": "Recommendation and Sentiment Analysis API",
         "version": "1.0",
+        "model_version": model_store.version,
         "endpoints": {
             "users": "/api/users",
             "items": "/api/items", 
             "ratings": "/api/ratings",
             "recommendations": "/api/recommendations/<user_id>",
+            "batch_recommendations": "/api/recommendations/batch",
             "sentiment": "/api/sentiment/<item_id>",
+            "sentiment_chart": "/api/sentiment/<item_id>/chart.png",
             "similar_users": "/api/similar-users/<user_id>",
-            "similar_items": "/api/similar-items/<item_id>"
+            "similar_items": "/api/similar-items/<item_id>",
+            "metrics": "/metrics",
+            "profiles": "/api/profiles"
         }
     })
 
@@ -76,7 +329,7 @@ def get_all_ratings():
 @app.route('/api/ratings/<int:user_id>', methods=['GET'])
 def get_user_ratings(user_id):
     """Return ratings for a specific user"""
-    user_ratings = [r for r in ratings if r['userId'] == user_id]
+    user_ratings = store.get_user_ratings(user_id)
     if user_ratings:
         return jsonify(user_ratings)
     return jsonify({"error": f"No ratings found for user with ID {user_id}"}), 404
@@ -84,15 +337,17 @@ def get_user_ratings(user_id):
 @app.route('/api/ratings/<int:user_id>/<int:item_id>', methods=['GET'])
 def get_specific_rating(user_id, item_id):
     """Return a specific rating"""
-    for rating in ratings:
-        if rating['userId'] == user_id and rating['itemId'] == item_id:
-            return jsonify(rating)
+    rating = store.get_rating(user_id, item_id)
+    if rating:
+        return jsonify(rating)
     return jsonify({"error": f"Rating not found for user {user_id} and item {item_id}"}), 404
 
 @app.route('/api/ratings', methods=['POST'])
 def add_rating():
     """Add a new rating"""
-    data = request.json
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
 
     # Validate required fields
     required_fields = ['userId', 'itemId', 'rating', 'review']
@@ -100,32 +355,55 @@ def add_rating():
         if field not in data:
             return jsonify({"error": f"Missing required field: {field}"}), 400
 
+    # Reject malformed values before they are stored: the log is replayed
+    # into the model at every startup
+    error = validate_rating(data)
+    if error:
+        return jsonify({"error": error}), 400
+
     # Add timestamp if not provided
     if 'timestamp' not in data:
-        import time
         data['timestamp'] = time.time()
 
-    # Add the new rating
-    ratings.append(data)
+    # Append to the ratings log
+    ratings_log.append(data)
 
-    # Save to JSON file
-    save_to_json()
+    # Add the rating to the store, sentiment aggregates and model. Workers
+    # sharing the log apply it (with any other worker's) by tailing the log
+    if ratings_tailer is not None:
+        ratings_tailer.poll()
+        snapshot = model_store.current
+    else:
+        snapshot = apply_rating(data)
 
-    # Retrain the model
-    global model
-    model = train_recommender()
-
-    return jsonify({"message": "Rating added successfully", "rating": data})
+    return jsonify({
+        "message": "Rating added successfully",
+        "rating": data,
+        "model_version": snapshot_version(snapshot)
+    })
 
 @app.route('/api/recommendations/<int:user_id>', methods=['GET'])
 def get_recommendations(user_id):
     """Get recommendations for a user"""
+    # Use one model version for the whole request
+    snapshot = model_store.current
+    model = snapshot.model
+
     if user_id not in model.user_to_idx:
         return jsonify({"error": f"User with ID {user_id} not found"}), 404
 
     try:
         # Get number of recommendations from query param or use default
         n_recommendations = int(request.args.get('n', 5))
+        if n_recommendations < 1:
+            return jsonify({"error": "n must be a positive integer"}), 400
+
+        # Serve the response computed for this model version if cached
+        version = snapshot_version(snapshot)
+        cache_key = ('recommendations', user_id, n_recommendations)
+        cached = response_cache.get(cache_key, version)
+        if cached is not None:
+            return cached_json_response(cached)
 
         # Get recommendations
         user_idx = model.user_to_idx[user_id]
@@ -147,9 +425,67 @@ def get_recommendations(user_id):
         # Get user info
         user_info = get_user_info(user_id)
 
-        return jsonify({
+        body = jsonify({
             'user': user_info,
-            'recommendations': result
+            'recommendations': result,
+            'model_version': version
+        }).get_data()
+        return cached_json_response(response_cache.put(cache_key, version, body))
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/recommendations/batch', methods=['POST'])
+def get_batch_recommendations():
+    """Get recommendations for many users in one call"""
+    # Use one model version for the whole request
+    snapshot = model_store.current
+    model = snapshot.model
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+
+    # Validate required fields
+    if 'userIds' not in data:
+        return jsonify({"error": "Missing required field: userIds"}), 400
+    requested_ids = data['userIds']
+    if not isinstance(requested_ids, list) or not all(
+            isinstance(user_id, (int, str)) and not isinstance(user_id, bool) for user_id in requested_ids):
+        return jsonify({"error": "userIds must be a list of user IDs"}), 400
+    if len(requested_ids) > MAX_BATCH_USERS:
+        return jsonify({"error": f"At most {MAX_BATCH_USERS} userIds per request"}), 400
+
+    try:
+        # Get number of recommendations from the body or use default
+        n_recommendations = int(data.get('n', 5))
+        if n_recommendations < 1:
+            return jsonify({"error": "n must be a positive integer"}), 400
+
+        # Split known users from unknown ones
+        user_ids = [user_id for user_id in requested_ids if user_id in model.user_to_idx]
+        missing_user_ids = [user_id for user_id in requested_ids if user_id not in model.user_to_idx]
+
+        # Get recommendations for all known users at once
+        user_indices = [model.user_to_idx[user_id] for user_id in user_ids]
+        batch = model.recommend_items_batch(user_indices, n_recommendations)
+
+        # Format the results
+        results = []
+        for user_id, recommendations in zip(user_ids, batch):
+            results.append({
+                'user_id': user_id,
+                'recommendations': [{
+                    'item': get_item_info(model.idx_to_item[item_idx]),
+                    'predicted_rating': float(predicted_rating),
+                    'similarity_score': 0.0  # Placeholder for item similarity
+                } for item_idx, predicted_rating in recommendations]
+            })
+
+        return jsonify({
+            'results': results,
+            'missing_user_ids': missing_user_ids,
+            'model_version': snapshot_version(snapshot)
         })
 
     except Exception as e:
@@ -158,12 +494,25 @@ def get_recommendations(user_id):
 @app.route('/api/similar-users/<int:user_id>', methods=['GET'])
 def get_similar_users(user_id):
     """Get users similar to the given user"""
+    # Use one model version for the whole request
+    snapshot = model_store.current
+    model = snapshot.model
+
     if user_id not in model.user_to_idx:
         return jsonify({"error": f"User with ID {user_id} not found"}), 404
 
     try:
         # Get number of similar users from query param or use default
         n_similar = int(request.args.get('n', 3))
+        if n_similar < 1:
+            return jsonify({"error": "n must be a positive integer"}), 400
+
+        # Serve the response computed for this model version if cached
+        version = snapshot_version(snapshot)
+        cache_key = ('similar-users', user_id, n_similar)
+        cached = response_cache.get(cache_key, version)
+        if cached is not None:
+            return cached_json_response(cached)
 
         # Get similar users
         user_idx = model.user_to_idx[user_id]
@@ -184,10 +533,12 @@ def get_similar_users(user_id):
         # Get user info
         user_info = get_user_info(user_id)
 
-        return jsonify({
+        body = jsonify({
             'user': user_info,
-            'similar_users': result
-        })
+            'similar_users': result,
+            'model_version': version
+        }).get_data()
+        return cached_json_response(response_cache.put(cache_key, version, body))
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -195,12 +546,25 @@ def get_similar_users(user_id):
 @app.route('/api/similar-items/<int:item_id>', methods=['GET'])
 def get_similar_items(item_id):
     """Get items similar to the given item"""
+    # Use one model version for the whole request
+    snapshot = model_store.current
+    model = snapshot.model
+
     if item_id not in model.item_to_idx:
         return jsonify({"error": f"Item with ID {item_id} not found"}), 404
 
     try:
         # Get number of similar items from query param or use default
         n_similar = int(request.args.get('n', 4))
+        if n_similar < 1:
+            return jsonify({"error": "n must be a positive integer"}), 400
+
+        # Serve the response computed for this model version if cached
+        version = snapshot_version(snapshot)
+        cache_key = ('similar-items', item_id, n_similar)
+        cached = response_cache.get(cache_key, version)
+        if cached is not None:
+            return cached_json_response(cached)
 
         # Get similar items
         item_idx = model.item_to_idx[item_id]
@@ -221,10 +585,12 @@ def get_similar_items(item_id):
         # Get item info
         item_info = get_item_info(item_id)
 
-        return jsonify({
+        body = jsonify({
             'item': item_info,
-            'similar_items': result
-        })
+            'similar_items': result,
+            'model_version': version
+        }).get_data()
+        return cached_json_response(response_cache.put(cache_key, version, body))
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -232,6 +598,8 @@ def get_similar_items(item_id):
 @app.route('/api/sentiment/<int:item_id>', methods=['GET'])
 def get_sentiment_analysis(item_id):
     """Get sentiment analysis for a specific item"""
+    from sentiment_analysis import analyze_item_reviews
+
     try:
         # Analyze the reviews
         results = analyze_item_reviews(item_id)
@@ -239,74 +607,82 @@ def get_sentiment_analysis(item_id):
         if 'error' in results:
             return jsonify({"error": results['error']}), 404
 
-        # Generate visualization
-        plt.figure(figsize=(15, 10))
-
-        # Plot 1: Sentiment Distribution
-        plt.subplot(2, 2, 1)
-        sentiment_counts = results['sentiment_counts']
-        labels = sentiment_counts.keys()
-        sizes = sentiment_counts.values()
-        plt.pie(sizes, labels=labels, autopct='%1.1f%%', startangle=90, colors=['green', 'red', 'gray'])
-        plt.title(f"Sentiment Distribution for {results['item']['name']}")
-
-        # Plot 2: Average Sentiment Scores
-        plt.subplot(2, 2, 2)
-        scores = [
-            results['avg_positive'],
-            results['avg_negative'],
-            results['avg_neutral']
-        ]
-        categories = ['Positive', 'Negative', 'Neutral']
-        colors = ['green', 'red', 'blue']
-        plt.bar(categories, scores, color=colors)
-        plt.title('Average Sentiment Scores')
-        plt.ylim(0, 1)
-
-        # Plot 3: Top Aspects
-        plt.subplot(2, 2, 3)
-        if results['top_aspects']:
-            aspects, counts = zip(*results['top_aspects'][:5])  # Get top 5 aspects
-            plt.bar(aspects, counts)
-            plt.title('Top 5 Aspects Mentioned in Reviews')
-            plt.xticks(rotation=45, ha='right')
-        else:
-            plt.text(0.5, 0.5, 'No aspects extracted', ha='center', va='center')
-            plt.title('Aspects Mentioned in Reviews')
-
-        # Plot 4: Compound Score Distribution
-        plt.subplot(2, 2, 4)
-        compound_scores = [r['sentiment']['compound'] for r in results['individual_results']]
-        sns.histplot(compound_scores, kde=True)
-        plt.title('Distribution of Compound Sentiment Scores')
-        plt.axvline(x=0, color='r', linestyle='--')
-
-        plt.tight_layout()
-
-        # Save the figure to a bytes buffer
-        buf = BytesIO()
-        plt.savefig(buf, format='png')
-        plt.close()
-        buf.seek(0)
-
-        # Encode the image as base64
-        img_str = base64.b64encode(buf.read()).decode('utf-8')
-
-        # Add visualization to results
-        results['visualization'] = f"data:image/png;base64,{img_str}"
-
-        # Remove individual results to reduce payload size
-        if 'individual_results' in results:
-            del results['individual_results']
+        # Link the chart; its URL changes with the item's aggregate version
+        # (the review count) so clients and CDNs can cache it indefinitely
+        results['visualization'] = url_for('get_sentiment_chart', item_id=item_id,
+                                           v=results['reviews_count'], _external=True)
 
         return jsonify(results)
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-if __name__ == '__main__':
-    # Create data directory and JSON files if they don't exist
-    if not os.path.exists('data'):
-        save_to_json()
+@app.route('/api/sentiment/<int:item_id>/chart.png', methods=['GET'])
+def get_sentiment_chart(item_id):
+    """Get the sentiment analysis chart for a specific item as PNG"""
+    from sentiment_analysis import analyze_item_reviews
+
+    try:
+        results = analyze_item_reviews(item_id, include_scores=True)
+
+        if 'error' in results:
+            return jsonify({"error": results['error']}), 404
+
+        # Only the URL of the current aggregate version may be cached
+        # indefinitely; the bare URL and stale versions redirect to it
+        version = results['reviews_count']
+        if request.args.get('v') != str(version):
+            response = redirect(url_for('get_sentiment_chart', item_id=item_id, v=version))
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+
+        # Rendered once per aggregate version, in the chart worker pool
+        png = chart_cache.get((item_id, version), results)
+
+        response = Response(png, mimetype='image/png')
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-    app.run(host='0.0.0.0', port=5000, debug=True)
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Return the process's metrics in the Prometheus text format"""
+    if not metrics.ENABLED:
+        return jsonify({"error": "Metrics are disabled (set METRICS_ENABLED=1)"}), 404
+
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/profiles', methods=['GET'])
+def list_profiles():
+    """List the stored request profiles, newest first"""
+    if profiler is None:
+        return jsonify({"error": "Profiling is disabled (set PROFILING_ENABLED=1)"}), 404
+    if not profiler.authorized(_profile_flag()):
+        return jsonify({"error": "Missing or invalid profiling token"}), 403
+
+    return jsonify(profiler.list_profiles())
+
+@app.route('/api/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """Download a stored request profile (pstats file, or a text report with ?format=text)"""
+    if profiler is None:
+        return jsonify({"error": "Profiling is disabled (set PROFILING_ENABLED=1)"}), 404
+    if not profiler.authorized(_profile_flag()):
+        return jsonify({"error": "Missing or invalid profiling token"}), 403
+
+    path = profiler.path(profile_id)
+    if path is None:
+        return jsonify({"error": f"Profile {profile_id} not found"}), 404
+
+    if request.args.get('format') == 'text':
+        try:
+            report = profiler.report(profile_id, sort=request.args.get('sort', 'cumulative'),
+                                     limit=int(request.args.get('limit', 50)))
+        except (KeyError, ValueError) as e:
+            return jsonify({"error": f"Invalid report option: {e}"}), 400
+        return Response(report, mimetype='text/plain')
+
+    return send_file(os.path.abspath(path), mimetype='application/octet-stream', as_attachment=True,
+                     download_name=f"{profile_id}.prof")
@@ -0,0 +1,234 @@
+"""
+Corpus-level aspect mining over all stored reviews.
+
+Reviews are streamed through the analyzer in chunks and their aspects are
+counted per item and per category with bounded space-saving counters, so
+memory stays proportional to the number of items rather than the number of
+reviews. The resulting index is saved to JSON and read by the sentiment
+API, which then serves top aspects without processing review text.
+
+Usage: python aspect_mining.py [--output data/aspect_index.json]
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+class SpaceSaving:
+    """
+    Space-saving top-K counter (Metwally et al.)
+
+    Keeps at most `capacity` terms. When a new term arrives and the counter
+    is full, it replaces the term with the smallest count and inherits that
+    count as its error, so every reported count is an upper bound that
+    overestimates by at most the smallest count in the counter.
+    """
+
+    def __init__(self, capacity=50):
+        """
+        Initialize an empty counter
+
+        Parameters:
+        -----------
+        capacity : int
+            Maximum number of terms tracked
+        """
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+
+    def add(self, term, count=1):
+        """Count occurrences of a term"""
+        if term in self.counts:
+            self.counts[term] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[term] = count
+            self.errors[term] = 0
+        else:
+            # Evict the smallest term; the newcomer may have been it
+            evicted = min(self.counts, key=self.counts.get)
+            floor = self.counts.pop(evicted)
+            del self.errors[evicted]
+            self.counts[term] = floor + count
+            self.errors[term] = floor
+
+    def most_common(self, n=10):
+        """Return up to n (term, count) pairs by descending count, ties by term"""
+        ranked = sorted(self.counts.items(), key=lambda entry: (-entry[1], entry[0]))
+        return ranked[:n]
+
+    def to_dict(self):
+        """Return a JSON-serializable representation"""
+        return {term: [count, self.errors[term]] for term, count in self.counts.items()}
+
+    @classmethod
+    def from_dict(cls, data, capacity):
+        """Rebuild a counter from to_dict output"""
+        counter = cls(capacity)
+        for term, (count, error) in data.items():
+            counter.counts[term] = count
+            counter.errors[term] = error
+        return counter
+
+class AspectIndex:
+    """Bounded per-item and per-category aspect counts over a ratings list"""
+
+    def __init__(self, capacity=50, category_capacity=200):
+        """
+        Initialize an empty index
+
+        Parameters:
+        -----------
+        capacity : int
+            Number of aspects tracked per item
+        category_capacity : int
+            Number of aspects tracked per category
+        """
+        self.capacity = capacity
+        self.category_capacity = category_capacity
+        self.items = {}
+        self.categories = {}
+        # Number of leading ratings already mined; ratings are append-only
+        self.n_ratings = 0
+        self.lock = threading.Lock()
+
+    def add(self, item_id, category, aspects):
+        """
+        Count the aspects of one review
+
+        Parameters:
+        -----------
+        item_id : int
+            The reviewed item
+        category : str or None
+            The item's category
+        aspects : list
+            Aspect terms extracted from the review
+        """
+        item_counter = self.items.get(item_id)
+        if item_counter is None:
+            item_counter = self.items[item_id] = SpaceSaving(self.capacity)
+
+        category_counter = None
+        if category is not None:
+            category_counter = self.categories.get(category)
+            if category_counter is None:
+                category_counter = self.categories[category] = SpaceSaving(self.category_capacity)
+
+        for aspect in aspects:
+            item_counter.add(aspect)
+            if category_counter is not None:
+                category_counter.add(aspect)
+
+    def update(self, ratings, items_by_id, analyzer, chunk_size=1000):
+        """
+        Mine the ratings added since the last update, one chunk at a time
+
+        Parameters:
+        -----------
+        ratings : list
+            The append-only ratings list
+        items_by_id : dict
+            Item records by ID, used to look up categories
+        analyzer : SentimentAnalyzer
+            Analyzer whose iter_aspects extracts the aspects
+        chunk_size : int
+            Number of reviews processed per chunk
+
+        Returns:
+        --------
+        int
+            Number of ratings mined
+        """
+        if self.n_ratings >= len(ratings):
+            return 0
+
+        with self.lock:
+            start = self.n_ratings
+            while self.n_ratings < len(ratings):
+                chunk = ratings[self.n_ratings:self.n_ratings + chunk_size]
+                texts = (rating.get('review') or '' for rating in chunk)
+                for rating, aspects in zip(chunk, analyzer.iter_aspects(texts)):
+                    item = items_by_id.get(rating['itemId'])
+                    self.add(rating['itemId'], item['category'] if item else None, aspects)
+                self.n_ratings += len(chunk)
+            return self.n_ratings - start
+
+    def top_aspects(self, item_id, n=10):
+        """Return the item's top (aspect, count) pairs, or None if it has no reviews indexed"""
+        counter = self.items.get(item_id)
+        return counter.most_common(n) if counter is not None else None
+
+    def top_category_aspects(self, category, n=10):
+        """Return the category's top (aspect, count) pairs, or None if it is not indexed"""
+        counter = self.categories.get(category)
+        return counter.most_common(n) if counter is not None else None
+
+    def save(self, path):
+        """Write the index to a JSON file atomically"""
+        with self.lock:
+            data = {
+                'capacity': self.capacity,
+                'category_capacity': self.category_capacity,
+                'n_ratings': self.n_ratings,
+                'items': {str(item_id): counter.to_dict() for item_id, counter in self.items.items()},
+                'categories': {category: counter.to_dict() for category, counter in self.categories.items()}
+            }
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Read an index written by save()"""
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+
+        index = cls(data['capacity'], data['category_capacity'])
+        index.n_ratings = data['n_ratings']
+        index.items = {
+            int(item_id): SpaceSaving.from_dict(counts, index.capacity)
+            for item_id, counts in data['items'].items()
+        }
+        index.categories = {
+            category: SpaceSaving.from_dict(counts, index.category_capacity)
+            for category, counts in data['categories'].items()
+        }
+        return index
+
+if __name__ == "__main__":
+    from data import ratings, store
+    from ratings_log import RatingsLog
+    from sentiment_analysis import get_analyzer
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--output', default=os.environ.get('ASPECT_INDEX_PATH', 'data/aspect_index.json'),
+                        help="Index file to write (ASPECT_INDEX_PATH for the API)")
+    parser.add_argument('--chunk-size', type=int, default=1000, help="Reviews processed per chunk")
+    parser.add_argument('--capacity', type=int, default=50, help="Aspects tracked per item")
+    parser.add_argument('--category-capacity', type=int, default=200, help="Aspects tracked per category")
+    parser.add_argument('--rebuild', action='store_true', help="Rebuild instead of extending an existing index")
+    args = parser.parse_args()
+
+    # Load the same ratings the API serves
+    ratings_log = RatingsLog('data', default=ratings)
+    store.load_ratings(ratings_log.load())
+    ratings_log.close()
+
+    # Extend an existing index with the ratings stored since it was written
+    if os.path.exists(args.output) and not args.rebuild:
+        index = AspectIndex.load(args.output)
+    else:
+        index = AspectIndex(args.capacity, args.category_capacity)
+
+    start = time.perf_counter()
+    mined = index.update(ratings, store.items_by_id, get_analyzer(), chunk_size=args.chunk_size)
+    elapsed = time.perf_counter() - start
+    index.save(args.output)
+
+    rate = mined / elapsed if elapsed > 0 else 0.0
+    print(f"Mined {mined} reviews in {elapsed:.2f}s ({rate:.0f} reviews/s); "
+          f"{len(index.items)} items and {len(index.categories)} categories indexed in {args.output}")
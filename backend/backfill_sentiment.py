@@ -0,0 +1,42 @@
+"""
+Score the sentiment of every stored review into the review sentiment cache
+"""
+import argparse
+import time
+from data import ratings, store
+from ratings_log import RatingsLog
+from sentiment_analysis import get_analyzer, ReviewSentimentCache, REVIEW_CACHE_PATH
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--cache-path', default=REVIEW_CACHE_PATH,
+                        help="Review sentiment cache file to fill (defaults to the API's SENTIMENT_CACHE_PATH)")
+    parser.add_argument('--jobs', type=int, default=-1, help="Worker processes (-1 for every CPU)")
+    parser.add_argument('--chunk-size', type=int, default=500, help="Reviews per worker task")
+    parser.add_argument('--rescore', action='store_true', help="Rescore reviews that are already cached")
+    args = parser.parse_args()
+    if not args.cache_path:
+        parser.error("no cache path: pass --cache-path or set SENTIMENT_CACHE_PATH")
+
+    # Load the same ratings the API serves
+    ratings_log = RatingsLog('data', default=ratings)
+    store.load_ratings(ratings_log.load())
+    ratings_log.close()
+
+    # The cache is keyed by review text, so every distinct review is scored once
+    reviews = list(dict.fromkeys(rating['review'] for rating in ratings if rating.get('review')))
+    cache = ReviewSentimentCache(max_size=max(len(reviews), 1), path=args.cache_path)
+    if not args.rescore:
+        reviews = [review for review in reviews if cache.get(review) is None]
+
+    start = time.perf_counter()
+    results = get_analyzer().score_reviews(reviews, n_jobs=args.jobs, chunk_size=args.chunk_size)
+    elapsed = time.perf_counter() - start
+
+    for review, result in zip(reviews, results):
+        cache.put(review, result)
+    cache.save()
+
+    rate = len(reviews) / elapsed if elapsed > 0 else 0.0
+    print(f"Scored {len(reviews)} reviews in {elapsed:.2f}s ({rate:.0f} reviews/s); "
+          f"{len(cache)} cached in {args.cache_path}")
@@ -0,0 +1,53 @@
+"""
+Benchmark review preprocessing throughput.
+
+Compares the original preprocessing (two re.sub passes, nltk.word_tokenize
+and an uncached lemmatizer) with SentimentAnalyzer.preprocess_text using the
+Treebank and regex tokenizers, and checks that the Treebank pipeline yields
+identical tokens.
+
+Usage: python benchmarks/preprocessing.py [n_reviews]
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from nltk.tokenize import word_tokenize
+from data import ratings
+from sentiment_analysis import SentimentAnalyzer
+
+def legacy_preprocess(analyzer, text):
+    """The original preprocess_text implementation"""
+    text = text.lower()
+    text = re.sub(r'[^\w\s]', '', text)
+    text = re.sub(r'\d+', '', text)
+    tokens = word_tokenize(text)
+    tokens = [token for token in tokens if token not in analyzer.stop_words]
+    return [analyzer.lemmatizer.lemmatize(token) for token in tokens]
+
+def throughput(preprocess, reviews):
+    """Return (reviews per second, tokens) for preprocessing every review"""
+    start = time.perf_counter()
+    tokens = [preprocess(review) for review in reviews]
+    return len(reviews) / (time.perf_counter() - start), tokens
+
+if __name__ == "__main__":
+    n_reviews = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    corpus = [rating['review'] for rating in ratings]
+    reviews = [corpus[i % len(corpus)] for i in range(n_reviews)]
+
+    treebank = SentimentAnalyzer(tokenizer='treebank')
+    regex = SentimentAnalyzer(tokenizer='regex')
+
+    legacy_rate, legacy_tokens = throughput(lambda text: legacy_preprocess(treebank, text), reviews)
+    treebank_rate, treebank_tokens = throughput(treebank.preprocess_text, reviews)
+    regex_rate, regex_tokens = throughput(regex.preprocess_text, reviews)
+
+    print(f"{'legacy':>10}: {legacy_rate:10.0f} reviews/s")
+    print(f"{'treebank':>10}: {treebank_rate:10.0f} reviews/s ({treebank_rate / legacy_rate:.1f}x), "
+          f"identical tokens: {treebank_tokens == legacy_tokens}")
+    print(f"{'regex':>10}: {regex_rate:10.0f} reviews/s ({regex_rate / legacy_rate:.1f}x), "
+          f"identical tokens: {regex_tokens == legacy_tokens}")
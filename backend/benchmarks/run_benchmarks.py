@@ -0,0 +1,267 @@
+"""
+Benchmark suite for the recommender and the API on synthetic data.
+
+For every dataset size it measures the time and peak traced memory of
+training, per-call latency percentiles of the model's query methods, and
+the throughput and latency of the recommendation endpoints through the
+Flask test client (in-process, so no network or server overhead). Results
+are written as JSON; pass an earlier results file to --compare to print
+the change of every metric.
+
+Usage: python benchmarks/run_benchmarks.py [--sizes small,medium] [--output results.json] [--compare old.json]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND_DIR)
+
+from data import store
+from collaborative_filtering import train_recommender
+from synthetic_data import generate_dataset
+
+# Named dataset sizes; custom sizes are given as USERSxITEMSxDENSITY
+SIZES = {
+    'small': {'n_users': 1000, 'n_items': 500, 'density': 0.02},
+    'medium': {'n_users': 10000, 'n_items': 2000, 'density': 0.005},
+    'large': {'n_users': 50000, 'n_items': 10000, 'density': 0.002},
+}
+
+def parse_size(name):
+    """Return the generate_dataset arguments of a named or USERSxITEMSxDENSITY size"""
+    if name in SIZES:
+        return SIZES[name]
+    n_users, n_items, density = name.split('x')
+    return {'n_users': int(n_users), 'n_items': int(n_items), 'density': float(density)}
+
+def summarize(latencies):
+    """Return mean and percentile latencies in milliseconds"""
+    latencies = 1000 * np.asarray(latencies)
+    return {
+        'mean_ms': float(latencies.mean()),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p90_ms': float(np.percentile(latencies, 90)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+    }
+
+def time_calls(fn, args_list):
+    """Call fn once per argument tuple and return the latency summary"""
+    latencies = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies)
+
+def bench_fit(repeat):
+    """Time training and measure its peak traced memory"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        model = train_recommender()
+        times.append(time.perf_counter() - start)
+
+    # Traced separately: tracemalloc slows allocation-heavy code down
+    tracemalloc.start()
+    train_recommender()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return model, {'seconds': min(times), 'peak_traced_mb': peak / 2 ** 20}
+
+def bench_model(model, n_calls, n, batch_size, rng):
+    """Measure per-call latency of the model's query methods"""
+    users = rng.integers(len(model.user_to_idx), size=n_calls)
+    items = rng.integers(len(model.item_to_idx), size=n_calls)
+    batches = [(rng.integers(len(model.user_to_idx), size=batch_size).tolist(), n)
+               for _ in range(max(1, n_calls // 10))]
+
+    results = {
+        'recommend_items': time_calls(model.recommend_items, [(int(u), n) for u in users]),
+        'recommend_items_batch': time_calls(model.recommend_items_batch, batches),
+        'get_similar_users': time_calls(model.get_similar_users, [(int(u), n) for u in users]),
+        'get_similar_items': time_calls(model.get_similar_items, [(int(i), n) for i in items]),
+    }
+
+    # partial_fit mutates the model, so it is measured last
+    ratings = [(model.idx_to_user[int(u)], model.idx_to_item[int(i)], int(r))
+               for u, i, r in zip(users, items, rng.integers(1, 6, size=n_calls))]
+    results['partial_fit'] = time_calls(model.partial_fit, ratings)
+
+    # First ratings of users and items unseen at fit time, which append
+    # rows to the factor arrays and entries to the ID mappings
+    first_user_id = max(model.user_to_idx) + 1
+    new_user_ratings = [(first_user_id + j, model.idx_to_item[int(i)], int(r))
+                        for j, (i, r) in enumerate(zip(items, rng.integers(1, 6, size=n_calls)))]
+    results['partial_fit_new_user'] = time_calls(model.partial_fit, new_user_ratings)
+    first_item_id = max(model.item_to_idx) + 1
+    new_item_ratings = [(model.idx_to_user[int(u)], first_item_id + j, int(r))
+                        for j, (u, r) in enumerate(zip(users, rng.integers(1, 6, size=n_calls)))]
+    results['partial_fit_new_item'] = time_calls(model.partial_fit, new_item_ratings)
+    return results
+
+def bench_endpoints(client, model, n_requests, n, batch_size, sentiment, rng):
+    """Measure latency and throughput of the API endpoints through the test client"""
+    user_ids = list(model.user_to_idx)
+    item_ids = list(model.item_to_idx)
+    users = [user_ids[i] for i in rng.integers(len(user_ids), size=n_requests)]
+    items = [item_ids[i] for i in rng.integers(len(item_ids), size=n_requests)]
+
+    requests = {
+        'GET /api/recommendations/<user_id>': [
+            ('get', f'/api/recommendations/{u}?n={n}', None) for u in users],
+        'POST /api/recommendations/batch': [
+            ('post', '/api/recommendations/batch',
+             {'userIds': [user_ids[i] for i in rng.integers(len(user_ids), size=batch_size)], 'n': n})
+            for _ in range(max(1, n_requests // 10))],
+        'GET /api/similar-users/<user_id>': [('get', f'/api/similar-users/{u}?n={n}', None) for u in users],
+        'GET /api/similar-items/<item_id>': [('get', f'/api/similar-items/{i}?n={n}', None) for i in items],
+    }
+    if sentiment:
+        requests['GET /api/sentiment/<item_id>'] = [('get', f'/api/sentiment/{i}', None) for i in items]
+
+    results = {}
+    for name, calls in requests.items():
+        latencies = []
+        start = time.perf_counter()
+        for method, url, body in calls:
+            call_start = time.perf_counter()
+            response = getattr(client, method)(url, json=body)
+            latencies.append(time.perf_counter() - call_start)
+            if response.status_code != 200:
+                raise RuntimeError(f"{method.upper()} {url} returned {response.status_code}")
+        elapsed = time.perf_counter() - start
+
+        results[name] = summarize(latencies)
+        results[name]['requests_per_s'] = len(calls) / elapsed
+    return results
+
+def run_size(name, args, rng):
+    """Run every benchmark on one dataset size"""
+    params = parse_size(name)
+
+    start = time.perf_counter()
+    users, items, ratings = generate_dataset(**params, seed=args.seed)
+    generate_seconds = time.perf_counter() - start
+    store.load(users, items, ratings)
+
+    model, fit = bench_fit(args.repeat)
+    result = {
+        'size': name,
+        'n_users': len(users),
+        'n_items': len(items),
+        'n_ratings': len(ratings),
+        'generate_seconds': generate_seconds,
+        'fit': fit,
+        'model': bench_model(model, args.calls, args.n, args.batch_size, rng),
+    }
+
+    if args.requests > 0:
+        # The app trains a model on import; afterwards the benchmark's models
+        # are swapped in directly
+        import app
+        app.model_store.install(train_recommender())
+        client = app.app.test_client()
+        result['endpoints'] = bench_endpoints(client, app.model_store.current.model, args.requests, args.n,
+                                              args.batch_size, args.sentiment, rng)
+
+    return result
+
+def metadata():
+    """Describe the code and machine the results were measured on"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+def flatten(result, prefix=''):
+    """Flatten nested result dicts into {'a.b.c': number}"""
+    flat = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+def compare(old, new):
+    """Print every metric of sizes present in both result files with its relative change"""
+    old_sizes = {result['size']: result for result in old['results']}
+    for result in new['results']:
+        if result['size'] not in old_sizes:
+            continue
+        print(f"\n{result['size']}: {old['meta'].get('commit')} -> {new['meta'].get('commit')}")
+        old_flat = flatten(old_sizes[result['size']])
+        for metric, value in flatten(result).items():
+            if metric in old_flat and old_flat[metric]:
+                change = 100 * (value - old_flat[metric]) / old_flat[metric]
+                print(f"  {metric:<60} {old_flat[metric]:12.3f} {value:12.3f} {change:+8.1f}%")
+
+def report(result):
+    """Print a human-readable summary of one size"""
+    print(f"\n{result['size']}: {result['n_users']} users, {result['n_items']} items, "
+          f"{result['n_ratings']} ratings")
+    print(f"  fit: {result['fit']['seconds']:.3f}s, peak {result['fit']['peak_traced_mb']:.1f}MB traced")
+    for section in ('model', 'endpoints'):
+        for name, stats in result.get(section, {}).items():
+            throughput = f"  {stats['requests_per_s']:8.0f} req/s" if 'requests_per_s' in stats else ''
+            print(f"  {name:<36} p50 {stats['p50_ms']:8.3f}ms  p99 {stats['p99_ms']:8.3f}ms{throughput}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', default='small,medium',
+                        help=f"Comma-separated sizes: {', '.join(SIZES)} or USERSxITEMSxDENSITY")
+    parser.add_argument('--repeat', type=int, default=3, help="Training runs per size (the fastest is reported)")
+    parser.add_argument('--calls', type=int, default=500, help="Calls per model method")
+    parser.add_argument('--requests', type=int, default=500, help="Requests per endpoint (0 to skip the API)")
+    parser.add_argument('--n', type=int, default=10, help="Recommendations or neighbors per call")
+    parser.add_argument('--batch-size', type=int, default=100, help="Users per batch recommendation call")
+    parser.add_argument('--sentiment', action='store_true', help="Also benchmark the sentiment endpoint")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed for data and queries")
+    parser.add_argument('--output', default='benchmark_results.json', help="JSON results file")
+    parser.add_argument('--compare', help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.compare) if args.compare else None
+
+    # The app keeps its ratings log and models relative to the working
+    # directory; isolate them from the real data
+    workdir = tempfile.mkdtemp(prefix='benchmarks-')
+    os.chdir(workdir)
+    os.environ.setdefault('MODEL_DIR', os.path.join(workdir, 'models'))
+    os.environ.setdefault('MODEL_WATCH_INTERVAL', '0')
+    os.environ.setdefault('REFIT_THRESHOLD', str(2 ** 31))
+
+    rng = np.random.default_rng(args.seed)
+    results = {'meta': metadata(), 'results': []}
+    for name in args.sizes.split(','):
+        result = run_size(name, args, rng)
+        report(result)
+        results['results'].append(result)
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if baseline:
+        with open(baseline) as f:
+            compare(json.load(f), results)
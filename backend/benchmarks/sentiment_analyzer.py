@@ -0,0 +1,48 @@
+"""
+Benchmark the per-request cost of the sentiment analyzer.
+
+Compares constructing a SentimentAnalyzer for every request (the old
+behavior of analyze_item_reviews) with reusing the process-wide analyzer
+from get_analyzer(). Caches are bypassed so both paths score every review.
+
+Usage: python benchmarks/sentiment_analyzer.py [n_requests]
+"""
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from data import store
+from sentiment_analysis import SentimentAnalyzer, get_analyzer
+
+def time_requests(make_analyzer, item_ids, n_requests):
+    """Time n_requests item analyses, returning per-request latencies in ms"""
+    latencies = []
+    for i in range(n_requests):
+        reviews = [r['review'] for r in store.get_item_ratings(item_ids[i % len(item_ids)])]
+        start = time.perf_counter()
+        make_analyzer().analyze_reviews(reviews)
+        latencies.append(1000 * (time.perf_counter() - start))
+    return np.array(latencies)
+
+def report(name, latencies):
+    """Print latency percentiles"""
+    print(f"{name:>24}: mean {latencies.mean():8.2f}ms  p50 {np.percentile(latencies, 50):8.2f}ms  "
+          f"p99 {np.percentile(latencies, 99):8.2f}ms")
+
+if __name__ == "__main__":
+    n_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    item_ids = [item_id for item_id in store.items_by_id if store.get_item_ratings(item_id)]
+
+    start = time.perf_counter()
+    get_analyzer()
+    print(f"Shared analyzer warm-up: {1000 * (time.perf_counter() - start):.2f}ms")
+
+    per_request = time_requests(SentimentAnalyzer, item_ids, n_requests)
+    shared = time_requests(get_analyzer, item_ids, n_requests)
+
+    report("new analyzer per request", per_request)
+    report("shared analyzer", shared)
+    print(f"Speedup (mean): {per_request.mean() / shared.mean():.1f}x")
@@ -0,0 +1,108 @@
+"""
+Benchmark the cold start of the recommendation-only path.
+
+Starts a fresh interpreter with `python -X importtime` in a temporary copy
+of the data directory, imports the app and serves one recommendation
+through the Flask test client. Reports the time
+to the first response, an import-time breakdown by top-level package, and
+any heavy optional dependency (NLTK, matplotlib, ...) that was loaded even
+though no sentiment endpoint was called.
+
+Usage: python benchmarks/startup.py [--runs 3] [--top 15] [--target 1.5]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Modules only the sentiment endpoints and offline tools should load
+HEAVY_MODULES = ['nltk', 'matplotlib', 'seaborn', 'pandas', 'sklearn', 'tensorflow', 'transformers']
+
+CHILD = f"""
+import json, sys, time
+sys.path.insert(0, {BACKEND_DIR!r})
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+user_id = next(iter(app.model_store.current.model.user_to_idx))
+status = client.get(f'/api/recommendations/{{user_id}}').status_code
+served = time.perf_counter()
+print('STARTUP ' + json.dumps({{
+    'import_s': imported - start,
+    'first_request_s': served - imported,
+    'status': status,
+    'heavy_modules': [m for m in {HEAVY_MODULES!r} if m in sys.modules],
+}}))
+"""
+
+def parse_importtime(stderr):
+    """Sum the self import time (seconds) of every module by top-level package"""
+    totals = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        totals[name.strip().split('.')[0]] += int(self_us) / 1e6
+    return dict(totals)
+
+def cold_start():
+    """Run one cold start in a fresh interpreter and return its measurements"""
+    # The app keeps its ratings log and models relative to the working
+    # directory; start it on a copy of the data so the real files are
+    # never appended to or repaired
+    with tempfile.TemporaryDirectory(prefix='startup-') as workdir:
+        shutil.copytree(os.path.join(BACKEND_DIR, 'data'), os.path.join(workdir, 'data'))
+        env = dict(os.environ)
+        env.setdefault('MODEL_DIR', os.path.join(workdir, 'models'))
+        env.setdefault('MODEL_WATCH_INTERVAL', '0')
+        env.setdefault('REFIT_THRESHOLD', str(2 ** 31))
+
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD], cwd=workdir, env=env,
+                              capture_output=True, text=True, check=True)
+        total = time.perf_counter() - start
+
+    line = next(line for line in proc.stdout.splitlines() if line.startswith('STARTUP '))
+    result = json.loads(line[len('STARTUP '):])
+    result['total_s'] = total
+    result['imports'] = parse_importtime(proc.stderr)
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=3, help="Cold starts to run (the median is reported)")
+    parser.add_argument('--top', type=int, default=15, help="Packages shown in the import breakdown")
+    parser.add_argument('--target', type=float, default=float(os.environ.get('COLD_START_TARGET', 1.5)),
+                        help="Cold start target in seconds (COLD_START_TARGET)")
+    parser.add_argument('--json', help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    runs = sorted((cold_start() for _ in range(args.runs)), key=lambda run: run['total_s'])
+    median = runs[len(runs) // 2]
+
+    print(f"Cold start (median of {len(runs)}): {median['total_s']:.3f}s total, "
+          f"{median['import_s']:.3f}s importing app, {median['first_request_s'] * 1000:.1f}ms first request "
+          f"(HTTP {median['status']})")
+    print(f"Import time by package ({sum(median['imports'].values()):.3f}s):")
+    for package, seconds in sorted(median['imports'].items(), key=lambda entry: -entry[1])[:args.top]:
+        print(f"  {package:>24}: {seconds * 1000:8.1f}ms")
+
+    heavy = median['heavy_modules']
+    print(f"Heavy modules loaded: {', '.join(heavy) if heavy else 'none'}")
+
+    passed = median['total_s'] <= args.target and not heavy
+    print(f"Target {args.target:.2f}s: {'PASS' if passed else 'FAIL'}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'target_s': args.target, 'passed': passed, 'runs': runs}, f, indent=2)
+
+    sys.exit(0 if passed else 1)
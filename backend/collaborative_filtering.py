@@ -1,16 +1,46 @@
 """
 Collaborative Filtering recommendation model using SVD matrix factorization.
 """
+import json
+import os
+import time
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from scipy.sparse.linalg import svds
-import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
-from data import create_rating_matrix, users, items, ratings
+from scipy.sparse import csr_matrix, issparse
+from ann_index import recall_at_k
+from ranking import top_k, top_k_batch
+from data import create_rating_matrix, store
+import metrics
+
+# Instrumentation (see metrics.py)
+_STAGE_SECONDS = metrics.histogram('recommender_stage_seconds', "Time spent in recommender stages and queries",
+                                   ['stage'])
+_SEARCHES = metrics.counter('recommender_searches_total', "Top-N searches by kind and the path that served them",
+                            ['kind', 'path'])
+_FIT_SECONDS = metrics.gauge('recommender_fit_seconds', "Duration of the last model fit")
+_MODEL_SIZE = metrics.gauge('recommender_model_size', "Users, items, factors and ratings of the last fitted model",
+                            ['dimension'])
+_MODEL_BYTES = metrics.gauge('recommender_model_bytes', "Memory held by the last fitted model's factor arrays")
+_MODEL_UPDATES = metrics.gauge('recommender_model_updates', "Ratings folded in since the last fit")
+
+# Version of the on-disk model artifact layout written by save(). Version 2
+# adds spare factor rows; load() still reads version 1 artifacts
+ARTIFACT_FORMAT_VERSION = 2
+
+# Arrays persisted by save(), each as <name>.npy so load() can memory-map it
+_ARTIFACT_ARRAYS = ['user_factors', 'item_factors', 'sigma', 'user_factors_normalized', 'item_factors_normalized']
+
+# Factor arrays saved with spare zero rows for the users and items folded in
+# after loading, keyed by the meta.json entry holding their row count
+_GROWABLE_ARRAYS = {'user_factors': 'n_users', 'user_factors_normalized': 'n_users',
+                    'item_factors': 'n_items', 'item_factors_normalized': 'n_items'}
 
 class CollaborativeFilteringRecommender:
     """Collaborative Filtering recommender using SVD matrix factorization"""
 
-    def __init__(self, n_factors=20):
+    def __init__(self, n_factors=20, store_predictions=False, n_neighbors=0, index_factory=None,
+                 n_top_recommendations=0):
         """
         Initialize the recommender system
 
@@ -18,17 +48,56 @@ class CollaborativeFilteringRecommender:
         -----------
         n_factors : int
             Number of latent factors to use in matrix factorization
+        store_predictions : bool
+            Whether to materialize the dense users x items predicted rating
+            matrix at fit time. By default only the factors are kept and
+            scores are computed per request, so memory is O((users+items)*k).
+        n_neighbors : int
+            Depth of the user-user and item-item neighbor tables precomputed
+            at fit time. get_similar_users/get_similar_items answer requests
+            for up to this many neighbors with a table lookup. 0 disables
+            the tables and every query is a single matrix-vector product.
+        index_factory : callable, optional
+            Zero-argument callable returning an approximate nearest-neighbor
+            index (an object with build(vectors) and search(query, k, exclude)
+            methods, e.g. ann_index.IVFIndex). When given, fit() builds one
+            index per search space and similarity/recommendation queries use
+            it instead of an exact scan over every vector.
+        n_top_recommendations : int
+            Depth of the per-user top recommendation table precomputed at
+            fit time. recommend_items answers requests for up to this many
+            items with an array slice, except for users who rated items
+            since the fit. 0 disables the table.
         """
         self.n_factors = n_factors
+        self.store_predictions = store_predictions
+        self.n_neighbors = n_neighbors
+        self.index_factory = index_factory
+        self.n_top_recommendations = n_top_recommendations
         self.user_to_idx = None
         self.item_to_idx = None
         self.idx_to_user = None
         self.idx_to_item = None
         self.user_factors = None
         self.item_factors = None
+        self.sigma = None
+        self.predicted_ratings = None
         self.rating_mean = None
         self.rating_matrix = None
         self.rating_matrix_normalized = None
+        self.user_factors_normalized = None
+        self.item_factors_normalized = None
+        self.user_neighbors = None
+        self.item_neighbors = None
+        self.user_index = None
+        self.item_index = None
+        self.recommendation_index = None
+        self.top_recommendations = None
+        self.rating_updates = {}
+        self.new_item_ratings = {}
+        self.n_updates = 0
+        self.n_ratings = None
+        self._row_buffers = {}
 
     def fit(self, rating_matrix):
         """
@@ -36,32 +105,290 @@ class CollaborativeFilteringRecommender:
 
         Parameters:
         -----------
-        rating_matrix : numpy.ndarray
-            User-item rating matrix
+        rating_matrix : numpy.ndarray or scipy.sparse matrix
+            User-item rating matrix. Sparse input is centered in place on
+            its stored ratings only and handed to svds without densifying.
         """
+        fit_start = time.perf_counter()
+
+        if issparse(rating_matrix):
+            rating_matrix = rating_matrix.tocsr()
         self.rating_matrix = rating_matrix
 
-        # Normalize the ratings (center around the mean)
-        self.rating_mean = np.mean(rating_matrix[rating_matrix > 0])
-        rating_matrix_normalized = rating_matrix.copy()
-        rating_matrix_normalized[rating_matrix > 0] -= self.rating_mean
-        self.rating_matrix_normalized = rating_matrix_normalized
+        # Ratings folded in since the last fit are part of the new matrix
+        self.rating_updates = {}
+        self.new_item_ratings = {}
+        self.n_updates = 0
 
-        # Apply SVD
-        u, sigma, vt = svds(rating_matrix_normalized, k=min(self.n_factors, min(rating_matrix.shape)-1))
+        # Normalize the ratings (center around the mean)
+        with _STAGE_SECONDS.time(('center',)):
+            if issparse(rating_matrix):
+                rating_matrix_normalized = rating_matrix.astype(np.float64)
+                self.rating_mean = rating_matrix_normalized.data.mean()
+                rating_matrix_normalized.data -= self.rating_mean
+            else:
+                self.rating_mean = np.mean(rating_matrix[rating_matrix > 0])
+                rating_matrix_normalized = rating_matrix.copy()
+                rating_matrix_normalized[rating_matrix > 0] -= self.rating_mean
+            self.rating_matrix_normalized = rating_matrix_normalized
 
-        # Convert sigma to diagonal matrix
-        sigma_diag = np.diag(sigma)
+        # Apply SVD (scipy.sparse.linalg is only imported by processes that train)
+        with _STAGE_SECONDS.time(('svd',)):
+            from scipy.sparse.linalg import svds
+            u, sigma, vt = svds(rating_matrix_normalized, k=min(self.n_factors, min(rating_matrix.shape)-1))
 
         # Save latent factors
+        self._row_buffers = {}
         self.user_factors = u
-        self.item_factors = vt.T
+        self.item_factors = np.ascontiguousarray(vt.T)
+        self.sigma = sigma
+
+        # Precompute unit-length factors so cosine similarity is a dot product
+        self.user_factors_normalized = _l2_normalize(self.user_factors)
+        self.item_factors_normalized = _l2_normalize(self.item_factors)
+
+        # Precompute the nearest neighbor tables
+        if self.n_neighbors > 0:
+            with _STAGE_SECONDS.time(('neighbor_tables',)):
+                self.user_neighbors = _build_neighbor_table(self.user_factors_normalized, self.n_neighbors)
+                self.item_neighbors = _build_neighbor_table(self.item_factors_normalized, self.n_neighbors)
+        else:
+            self.user_neighbors = None
+            self.item_neighbors = None
+
+        # Build the approximate nearest-neighbor indexes. Recommendations
+        # rank items by user_factor . (sigma * item_factor), so that index
+        # holds the sigma-scaled item factors for maximum-inner-product search
+        if self.index_factory is not None:
+            with _STAGE_SECONDS.time(('ann_indexes',)):
+                self.user_index = self.index_factory().build(self.user_factors_normalized)
+                self.item_index = self.index_factory().build(self.item_factors_normalized)
+                self.recommendation_index = self.index_factory().build(self.item_factors * self.sigma)
+        else:
+            self.user_index = None
+            self.item_index = None
+            self.recommendation_index = None
 
         # Predict ratings using matrix factorization
-        self.predicted_ratings = self.rating_mean + np.dot(np.dot(u, sigma_diag), vt)
+        if self.store_predictions:
+            with _STAGE_SECONDS.time(('predictions',)):
+                self.predicted_ratings = self.predict_users(np.arange(u.shape[0]))
+        else:
+            self.predicted_ratings = None
+
+        # Precompute every user's top recommendations
+        if self.n_top_recommendations > 0:
+            with _STAGE_SECONDS.time(('recommendation_table',)):
+                self.top_recommendations = self._build_recommendation_table(self.n_top_recommendations)
+        else:
+            self.top_recommendations = None
+
+        _FIT_SECONDS.set(time.perf_counter() - fit_start)
+        self._record_size_metrics()
+
+        return self
+
+    def _record_size_metrics(self):
+        """Publish the model's dimensions to the model size gauges"""
+        _MODEL_SIZE.set(self.user_factors.shape[0], ('users',))
+        _MODEL_SIZE.set(self.item_factors.shape[0], ('items',))
+        _MODEL_SIZE.set(len(self.sigma), ('factors',))
+        if issparse(self.rating_matrix):
+            _MODEL_SIZE.set(self.rating_matrix.nnz, ('ratings',))
+        else:
+            _MODEL_SIZE.set(np.count_nonzero(self.rating_matrix), ('ratings',))
+        _MODEL_BYTES.set(sum(getattr(self, name).nbytes for name in _ARTIFACT_ARRAYS))
+        _MODEL_UPDATES.set(self.n_updates)
+
+    @metrics.timed(_STAGE_SECONDS, ('partial_fit',))
+    def partial_fit(self, user_id, item_id, rating):
+        """
+        Incorporate a single new rating without refitting the SVD
+
+        The item factors and sigma stay fixed; the user's latent vector is
+        recomputed by folding in all of their ratings (u = r V sigma^-1 on
+        the mean-centered rating row). A new item is folded in the same way
+        from the ratings it has received since the last fit, and new users
+        and items are appended to the ID mappings. Neighbor tables and
+        approximate indexes are not updated until the next full fit, and the
+        user's row of the recommendation table is bypassed until then.
+
+        The ID mappings, rating dicts and grown factor arrays are replaced
+        rather than modified (new users and items take spare rows and
+        mapping entries past the end of what the original sees), so a
+        shallow copy of the model (copy.copy) can be folded into while
+        readers keep using the original (see ModelStore.add_rating). Factor
+        rows of existing users and items are the exception: all copies share
+        them and they are overwritten in place (the factor row first, then
+        its normalized row), so readers of the original may already see the
+        refreshed vectors.
+
+        Parameters:
+        -----------
+        user_id : int
+            ID of the user who rated the item
+        item_id : int
+            ID of the rated item
+        rating : float
+            The rating value
+
+        Returns:
+        --------
+        self
+        """
+        # Folded-in users no longer match a materialized prediction matrix
+        self.predicted_ratings = None
+
+        # Factors memory-mapped read-only (mmap_mode='r') are copied before
+        # the first in-place update. load() maps them copy-on-write by
+        # default, so that only the written pages stop being shared
+        for name in _ARTIFACT_ARRAYS:
+            array = getattr(self, name)
+            if not array.flags.writeable:
+                setattr(self, name, np.array(array))
+                self._row_buffers = {key: buffer for key, buffer in self._row_buffers.items() if key != name}
+
+        item_idx = self.item_to_idx.get(item_id)
+        if item_idx is None:
+            item_idx = self._add_item(item_id)
+
+        user_idx = self.user_to_idx.get(user_id)
+        if user_idx is None:
+            user_idx = self._add_user(user_id)
+
+        user_updates = dict(self.rating_updates.get(user_idx, {}))
+        user_updates[item_idx] = float(rating)
+        self.rating_updates = {**self.rating_updates, user_idx: user_updates}
+        self.n_updates += 1
+        _MODEL_UPDATES.set(self.n_updates)
+
+        # Items unseen at fit time are folded in from their new ratings
+        if item_idx in self.new_item_ratings:
+            item_ratings = dict(self.new_item_ratings[item_idx])
+            item_ratings[user_idx] = float(rating)
+            self.new_item_ratings = {**self.new_item_ratings, item_idx: item_ratings}
+            item_vector = _fold_in(self.user_factors, self.sigma, list(item_ratings.keys()),
+                                   np.array(list(item_ratings.values())) - self.rating_mean)
+            self._set_item_vector(item_idx, item_vector)
+
+        # Fold in the user's whole rating row against the item factors
+        item_indices, values = self._user_ratings(user_idx)
+        user_vector = _fold_in(self.item_factors, self.sigma, item_indices, values - self.rating_mean)
+        self._set_user_vector(user_idx, user_vector)
 
         return self
 
+    def _add_user(self, user_id):
+        """Append a user with a zero latent vector and return its index"""
+        user_idx = self.user_factors.shape[0]
+
+        # Grow the arrays before publishing the ID so readers never see an
+        # index without a factor row
+        self._append_row('user_factors')
+        self._append_row('user_factors_normalized')
+
+        self.idx_to_user = _GrowingMap.of(self.idx_to_user, by_index=True).added(user_idx, user_id)
+        self.user_to_idx = _GrowingMap.of(self.user_to_idx).added(user_id, user_idx)
+        return user_idx
+
+    def _add_item(self, item_id):
+        """Append an item with a zero latent vector and return its index"""
+        item_idx = self.item_factors.shape[0]
+
+        self._append_row('item_factors')
+        self._append_row('item_factors_normalized')
+        self.new_item_ratings = {**self.new_item_ratings, item_idx: {}}
+
+        self.idx_to_item = _GrowingMap.of(self.idx_to_item, by_index=True).added(item_idx, item_id)
+        self.item_to_idx = _GrowingMap.of(self.item_to_idx).added(item_id, item_idx)
+        return item_idx
+
+    def _append_row(self, name):
+        """
+        Append a zero row to a factor array
+
+        The array becomes a view of the first rows of a buffer with spare
+        capacity, grown geometrically, so appending costs O(k) amortized
+        instead of a copy of the whole array. The view held before (e.g. by
+        the model this one was shallow-copied from) keeps its shape.
+        """
+        array = getattr(self, name)
+        n_rows = array.shape[0]
+        buffer = self._row_buffers.get(name)
+
+        # Only the newest copy of the model may take the next spare row;
+        # any other copy (or a full buffer) moves to a new one
+        if buffer is None or buffer.n_rows != n_rows or buffer.data.shape[0] == n_rows:
+            data = np.empty((n_rows + max(n_rows // 2, 16), array.shape[1]), dtype=array.dtype)
+            data[:n_rows] = array
+            buffer = _RowBuffer(data, n_rows)
+            self._row_buffers = {**self._row_buffers, name: buffer}
+
+        buffer.data[n_rows] = 0
+        buffer.n_rows = n_rows + 1
+        setattr(self, name, buffer.data[:n_rows + 1])
+
+    def _set_user_vector(self, user_idx, vector):
+        """Replace a user's latent vector and its normalized copy"""
+        self.user_factors[user_idx] = vector
+        self.user_factors_normalized[user_idx] = _l2_normalize(vector[None, :])[0]
+
+    def _set_item_vector(self, item_idx, vector):
+        """Replace an item's latent vector and its normalized copy"""
+        self.item_factors[item_idx] = vector
+        self.item_factors_normalized[item_idx] = _l2_normalize(vector[None, :])[0]
+
+    def _user_ratings(self, user_idx):
+        """Return (item_indices, ratings) arrays of a user, including updates since fit"""
+        row = {}
+        if user_idx < self.rating_matrix.shape[0]:
+            if issparse(self.rating_matrix):
+                start, stop = self.rating_matrix.indptr[user_idx:user_idx + 2]
+                row.update(zip(self.rating_matrix.indices[start:stop], self.rating_matrix.data[start:stop]))
+            else:
+                rated = np.flatnonzero(self.rating_matrix[user_idx, :] > 0)
+                row.update(zip(rated, self.rating_matrix[user_idx, rated]))
+        row.update(self.rating_updates.get(user_idx, {}))
+        return np.array(list(row.keys()), dtype=np.int64), np.array(list(row.values()), dtype=np.float64)
+
+    def predict_user(self, user_idx):
+        """
+        Predict ratings of every item for a single user
+
+        Parameters:
+        -----------
+        user_idx : int
+            User index in the rating matrix
+
+        Returns:
+        --------
+        numpy.ndarray
+            Predicted rating for each item (a fresh array the caller may modify)
+        """
+        if self.predicted_ratings is not None:
+            return self.predicted_ratings[user_idx, :].copy()
+        return self.rating_mean + np.dot(self.item_factors, self.user_factors[user_idx] * self.sigma)
+
+    def predict_users(self, user_indices):
+        """
+        Predict ratings of every item for a batch of users
+
+        Parameters:
+        -----------
+        user_indices : array-like of int
+            User indices in the rating matrix
+
+        Returns:
+        --------
+        numpy.ndarray
+            Matrix of shape (len(user_indices), n_items) of predicted ratings
+        """
+        user_indices = np.asarray(user_indices)
+        if self.predicted_ratings is not None:
+            return self.predicted_ratings[user_indices, :]
+        return self.rating_mean + np.dot(self.user_factors[user_indices] * self.sigma, self.item_factors.T)
+
+    @metrics.timed(_STAGE_SECONDS, ('recommend_items',))
     def recommend_items(self, user_idx, n_recommendations=5, exclude_rated=True):
         """
         Generate recommendations for a user
@@ -80,20 +407,181 @@ class CollaborativeFilteringRecommender:
         recommendations : list of tuples
             List of (item_idx, predicted_rating) tuples
         """
+        # Serve from the precomputed table when it is deep enough. It excludes
+        # the items rated at fit time, so rows of users who rated items since
+        # (or who were added since) are stale and scored live instead
+        if exclude_rated and self.top_recommendations is not None:
+            indices, scores = self.top_recommendations
+            if (0 < n_recommendations <= indices.shape[1] and user_idx < indices.shape[0]
+                    and user_idx not in self.rating_updates):
+                _SEARCHES.inc(labels=('recommend', 'table'))
+                return list(zip(indices[user_idx, :n_recommendations], scores[user_idx, :n_recommendations]))
+
+        # Search the approximate index when one was built; fall back to the
+        # exact scan if the probed lists held too few candidates
+        if self.recommendation_index is not None:
+            exclude = self._rated_items(user_idx) if exclude_rated else None
+            top_indices, scores = self.recommendation_index.search(
+                self.user_factors[user_idx], n_recommendations, exclude=exclude)
+            if len(top_indices) == n_recommendations:
+                _SEARCHES.inc(labels=('recommend', 'ann'))
+                return [(idx, self.rating_mean + score) for idx, score in zip(top_indices, scores)]
+            _SEARCHES.inc(labels=('recommend', 'ann_fallback'))
+        else:
+            _SEARCHES.inc(labels=('recommend', 'exact'))
+
         # Get user's predicted ratings
-        user_ratings = self.predicted_ratings[user_idx, :]
+        user_ratings = self.predict_user(user_idx)
 
         # If excluding rated items, set their ratings to -inf
         if exclude_rated:
-            already_rated = self.rating_matrix[user_idx, :] > 0
-            user_ratings[already_rated] = -np.inf
+            user_ratings[self._rated_items(user_idx)] = -np.inf
 
         # Get top N item indices
-        top_indices = np.argsort(user_ratings)[::-1][:n_recommendations]
+        top_indices = top_k(user_ratings, n_recommendations)
 
         # Return recommendations as (item_idx, predicted_rating) tuples
         return [(idx, user_ratings[idx]) for idx in top_indices]
 
+    @metrics.timed(_STAGE_SECONDS, ('recommend_items_batch',))
+    def recommend_items_batch(self, user_indices, n_recommendations=5, exclude_rated=True,
+                              memory_budget=64 * 2 ** 20):
+        """
+        Generate recommendations for many users at once
+
+        Users are scored in blocks: each block is one matrix product of the
+        users' factors against the item factors, followed by masking of the
+        already rated items and a batched top-N selection. The block size is
+        derived from the memory budget, so peak memory stays bounded however
+        many items there are. This always uses the exact scores, not the
+        approximate index.
+
+        Parameters:
+        -----------
+        user_indices : array-like of int
+            User indices in the rating matrix
+        n_recommendations : int
+            Number of recommendations to generate per user
+        exclude_rated : bool
+            Whether to exclude items that each user has already rated
+        memory_budget : int
+            Bytes of scratch memory for one block of scores
+
+        Returns:
+        --------
+        recommendations : list of lists of tuples
+            For each user, in input order, a list of (item_idx, predicted_rating) tuples
+        """
+        user_indices = np.asarray(user_indices, dtype=np.int64)
+        recommendations = []
+        block_size = _block_size(self.item_factors.shape[0], memory_budget)
+
+        for start in range(0, len(user_indices), block_size):
+            block = user_indices[start:start + block_size]
+
+            # Score the whole block with one matrix product
+            scores = self.predict_users(block)
+
+            # If excluding rated items, set their ratings to -inf
+            if exclude_rated:
+                scores[self._rated_entries(block)] = -np.inf
+
+            # Get top N item indices for every user in the block
+            top_indices = top_k_batch(scores, n_recommendations)
+            top_scores = np.take_along_axis(scores, top_indices, axis=1)
+
+            recommendations.extend(list(zip(indices, values)) for indices, values in zip(top_indices, top_scores))
+
+        return recommendations
+
+    def _build_recommendation_table(self, depth, memory_budget=256 * 2 ** 20, max_workers=4, n_jobs=None):
+        """
+        Precompute the top recommendations of every user
+
+        Users are scored and ranked in blocks as in recommend_items_batch,
+        with the blocks spread over a thread pool (NumPy releases the GIL in
+        the matrix products and selections). The block size is derived from
+        the memory budget, so peak memory stays bounded however many items
+        there are.
+
+        Parameters:
+        -----------
+        depth : int
+            Number of recommendations kept per user
+        memory_budget : int
+            Bytes of scratch memory shared by all threads' blocks
+        max_workers : int
+            Maximum number of threads
+        n_jobs : int, optional
+            Number of threads (defaults to the number of CPUs, at most max_workers)
+
+        Returns:
+        --------
+        tuple
+            (indices, scores) arrays of shape (n_users, depth): int32 item
+            indices and float32 predicted ratings, rated items excluded
+        """
+        n_users, n_items = self.user_factors.shape[0], self.item_factors.shape[0]
+        depth = min(depth, n_items)
+        indices = np.empty((n_users, depth), dtype=np.int32)
+        scores = np.empty((n_users, depth), dtype=np.float32)
+
+        n_jobs = max(1, min(n_jobs or os.cpu_count() or 1, max_workers))
+        block_size = _block_size(n_items, memory_budget, n_jobs)
+
+        def fill_block(start):
+            stop = min(start + block_size, n_users)
+            block = np.arange(start, stop)
+            block_scores = self.predict_users(block)
+            block_scores[self._rated_entries(block)] = -np.inf
+
+            top_indices = top_k_batch(block_scores, depth)
+            indices[start:stop] = top_indices
+            scores[start:stop] = np.take_along_axis(block_scores, top_indices, axis=1)
+
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            list(executor.map(fill_block, range(0, n_users, block_size)))
+
+        return indices, scores
+
+    def _rated_entries(self, user_indices):
+        """Return (row, item_idx) arrays of the ratings of a block of users"""
+        # Users added since the last fit have no row in the rating matrix
+        in_matrix = np.flatnonzero(user_indices < self.rating_matrix.shape[0])
+        if issparse(self.rating_matrix):
+            rows, cols = self.rating_matrix[user_indices[in_matrix]].nonzero()
+        else:
+            rows, cols = np.nonzero(self.rating_matrix[user_indices[in_matrix]] > 0)
+        rows = in_matrix[rows]
+
+        if not self.rating_updates:
+            return rows, cols
+
+        # Add the ratings folded in since the last fit
+        extra_rows = []
+        extra_cols = []
+        for row, user_idx in enumerate(user_indices):
+            for item_idx in self.rating_updates.get(int(user_idx), ()):
+                extra_rows.append(row)
+                extra_cols.append(item_idx)
+        return (np.concatenate([rows, np.array(extra_rows, dtype=rows.dtype)]),
+                np.concatenate([cols, np.array(extra_cols, dtype=cols.dtype)]))
+
+    def _rated_items(self, user_idx):
+        """Return the item indices the user has rated"""
+        if user_idx >= self.rating_matrix.shape[0]:
+            rated = np.empty(0, dtype=np.int64)
+        elif issparse(self.rating_matrix):
+            indptr = self.rating_matrix.indptr
+            rated = self.rating_matrix.indices[indptr[user_idx]:indptr[user_idx + 1]]
+        else:
+            rated = np.flatnonzero(self.rating_matrix[user_idx, :] > 0)
+
+        if user_idx in self.rating_updates:
+            rated = np.union1d(rated, list(self.rating_updates[user_idx].keys()))
+        return rated
+
+    @metrics.timed(_STAGE_SECONDS, ('get_similar_users',))
     def get_similar_users(self, user_idx, n_similar=5):
         """
         Find users similar to the given user
@@ -110,21 +598,9 @@ class CollaborativeFilteringRecommender:
         similar_users : list of tuples
             List of (user_idx, similarity_score) tuples
         """
-        # Compute cosine similarity between users
-        user_similarity = cosine_similarity(self.user_factors)
-
-        # Get similarity scores for the specified user
-        similarities = user_similarity[user_idx, :]
-
-        # Set self-similarity to -inf to exclude from results
-        similarities[user_idx] = -np.inf
-
-        # Get top N similar user indices
-        top_indices = np.argsort(similarities)[::-1][:n_similar]
-
-        # Return similar users as (user_idx, similarity) tuples
-        return [(idx, similarities[idx]) for idx in top_indices]
+        return _most_similar(self.user_factors_normalized, self.user_neighbors, self.user_index, user_idx, n_similar)
 
+    @metrics.timed(_STAGE_SECONDS, ('get_similar_items',))
     def get_similar_items(self, item_idx, n_similar=5):
         """
         Find items similar to the given item
@@ -141,32 +617,373 @@ class CollaborativeFilteringRecommender:
         similar_items : list of tuples
             List of (item_idx, similarity_score) tuples
         """
-        # Compute cosine similarity between items
-        item_similarity = cosine_similarity(self.item_factors)
+        return _most_similar(self.item_factors_normalized, self.item_neighbors, self.item_index, item_idx, n_similar)
+
+    def evaluate_ann_recall(self, k=10, n_queries=100):
+        """
+        Report recall@k and latency of the approximate indexes against exact search
+
+        Parameters:
+        -----------
+        k : int
+            Number of neighbors compared per query
+        n_queries : int
+            Number of random queries per index
+
+        Returns:
+        --------
+        dict
+            recall_at_k results keyed by 'similar_users', 'similar_items'
+            and 'recommendations', or an empty dict without an index
+        """
+        if self.recommendation_index is None:
+            return {}
+
+        return {
+            'similar_users': recall_at_k(self.user_index, self.user_factors_normalized, k=k, n_queries=n_queries),
+            'similar_items': recall_at_k(self.item_index, self.item_factors_normalized, k=k, n_queries=n_queries),
+            'recommendations': recall_at_k(self.recommendation_index, self.item_factors * self.sigma,
+                                           queries=self.user_factors, k=k, n_queries=n_queries),
+        }
+
+    def save(self, path):
+        """
+        Save the fitted model as a directory of .npy arrays plus meta.json
+
+        Every array is stored as a separate .npy file so load() can open it
+        with mmap_mode and worker processes share one copy through the page
+        cache. The factor arrays get spare zero rows, so users and items
+        folded in after loading take rows of the mapping instead of a copy
+        of the whole array. Ratings folded in with partial_fit are not saved.
+
+        Parameters:
+        -----------
+        path : str
+            Directory to write the artifact to (created if missing)
+        """
+        os.makedirs(path, exist_ok=True)
+
+        for name in _ARTIFACT_ARRAYS:
+            array = getattr(self, name)
+            if name not in _GROWABLE_ARRAYS:
+                np.save(os.path.join(path, f"{name}.npy"), array)
+                continue
+            n_rows = array.shape[0]
+            stored = np.lib.format.open_memmap(os.path.join(path, f"{name}.npy"), mode='w+', dtype=array.dtype,
+                                               shape=(n_rows + max(n_rows // 8, 1024), array.shape[1]))
+            stored[:n_rows] = array
+            stored[n_rows:] = 0
+            stored.flush()
+            del stored
+
+        # ID mappings as index-ordered ID arrays
+        user_ids = np.array([self.idx_to_user[i] for i in range(len(self.idx_to_user))])
+        item_ids = np.array([self.idx_to_item[i] for i in range(len(self.idx_to_item))])
+        np.save(os.path.join(path, 'user_ids.npy'), user_ids)
+        np.save(os.path.join(path, 'item_ids.npy'), item_ids)
+
+        # Rated items are needed to exclude them from recommendations
+        rating_matrix = csr_matrix(self.rating_matrix)
+        np.save(os.path.join(path, 'rating_data.npy'), rating_matrix.data)
+        np.save(os.path.join(path, 'rating_indices.npy'), rating_matrix.indices)
+        np.save(os.path.join(path, 'rating_indptr.npy'), rating_matrix.indptr)
+
+        if self.user_neighbors is not None:
+            np.save(os.path.join(path, 'user_neighbors.npy'), self.user_neighbors[0])
+            np.save(os.path.join(path, 'user_neighbor_scores.npy'), self.user_neighbors[1])
+            np.save(os.path.join(path, 'item_neighbors.npy'), self.item_neighbors[0])
+            np.save(os.path.join(path, 'item_neighbor_scores.npy'), self.item_neighbors[1])
+
+        if self.top_recommendations is not None:
+            np.save(os.path.join(path, 'top_recommendations.npy'), self.top_recommendations[0])
+            np.save(os.path.join(path, 'top_recommendation_scores.npy'), self.top_recommendations[1])
+
+        # Write meta.json last: an artifact without it is incomplete
+        meta = {
+            'format_version': ARTIFACT_FORMAT_VERSION,
+            'n_factors': self.n_factors,
+            'n_neighbors': self.n_neighbors,
+            'n_top_recommendations': self.n_top_recommendations,
+            'rating_mean': float(self.rating_mean),
+            'rating_shape': list(rating_matrix.shape),
+            'n_users': self.user_factors.shape[0],
+            'n_items': self.item_factors.shape[0],
+            'n_ratings': self.n_ratings,
+            'saved_at': time.time()
+        }
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+
+    @classmethod
+    def load(cls, path, mmap_mode='c', index_factory=None):
+        """
+        Load a model saved with save()
+
+        Parameters:
+        -----------
+        path : str
+            Artifact directory
+        mmap_mode : str, optional
+            numpy.load memory-map mode for the arrays ('c' to share them
+            between processes copy-on-write, so partial_fit only copies the
+            pages it writes; 'r' to share them read-only, copied in full by
+            the first partial_fit; None to read them into memory)
+        index_factory : callable, optional
+            Approximate nearest-neighbor index factory; indexes are rebuilt
+            from the loaded factors
+
+        Returns:
+        --------
+        CollaborativeFilteringRecommender
+            The loaded model
+        """
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta['format_version'] not in (1, ARTIFACT_FORMAT_VERSION):
+            raise ValueError(f"Unsupported model artifact format version: {meta['format_version']}")
 
-        # Get similarity scores for the specified item
-        similarities = item_similarity[item_idx, :]
+        def load_array(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
 
-        # Set self-similarity to -inf to exclude from results
-        similarities[item_idx] = -np.inf
+        model = cls(n_factors=meta['n_factors'], n_neighbors=meta['n_neighbors'], index_factory=index_factory,
+                    n_top_recommendations=meta.get('n_top_recommendations', 0))
+        for name in _ARTIFACT_ARRAYS:
+            array = load_array(name)
+            n_rows = meta.get(_GROWABLE_ARRAYS.get(name), array.shape[0])
+            if n_rows < array.shape[0]:
+                # The rows past n_rows are spare capacity (see _append_row)
+                model._row_buffers[name] = _RowBuffer(array, n_rows)
+                array = array[:n_rows]
+            setattr(model, name, array)
+        model.rating_mean = meta['rating_mean']
+        model.n_ratings = meta['n_ratings']
 
-        # Get top N similar item indices
-        top_indices = np.argsort(similarities)[::-1][:n_similar]
+        user_ids = load_array('user_ids').tolist()
+        item_ids = load_array('item_ids').tolist()
+        model.idx_to_user = dict(enumerate(user_ids))
+        model.idx_to_item = dict(enumerate(item_ids))
+        model.user_to_idx = {user_id: idx for idx, user_id in enumerate(user_ids)}
+        model.item_to_idx = {item_id: idx for idx, item_id in enumerate(item_ids)}
 
-        # Return similar items as (item_idx, similarity) tuples
-        return [(idx, similarities[idx]) for idx in top_indices]
+        model.rating_matrix = csr_matrix(
+            (load_array('rating_data'), load_array('rating_indices'), load_array('rating_indptr')),
+            shape=tuple(meta['rating_shape'])
+        )
 
-def train_recommender():
-    """Train the collaborative filtering recommender using the sample data"""
-    # Create rating matrix
-    rating_matrix, user_to_idx, item_to_idx = create_rating_matrix()
+        if os.path.exists(os.path.join(path, 'user_neighbors.npy')):
+            model.user_neighbors = (load_array('user_neighbors'), load_array('user_neighbor_scores'))
+            model.item_neighbors = (load_array('item_neighbors'), load_array('item_neighbor_scores'))
+
+        if os.path.exists(os.path.join(path, 'top_recommendations.npy')):
+            model.top_recommendations = (load_array('top_recommendations'), load_array('top_recommendation_scores'))
+
+        if index_factory is not None:
+            model.user_index = index_factory().build(model.user_factors_normalized)
+            model.item_index = index_factory().build(model.item_factors_normalized)
+            model.recommendation_index = index_factory().build(model.item_factors * model.sigma)
+
+        model._record_size_metrics()
+        return model
+
+class _RowBuffer:
+    """Factor array storage with spare rows, of which the first n_rows are in use"""
+
+    __slots__ = ('data', 'n_rows')
+
+    def __init__(self, data, n_rows):
+        self.data = data
+        self.n_rows = n_rows
+
+class _GrowingMap(Mapping):
+    """
+    Read-only ID mapping built at fit time plus the entries added since
+
+    Added entries go to a dict shared by the model's shallow copies, each of
+    which only sees the entries whose index is below its own size. Adding an
+    entry is therefore O(1) and leaves the mappings held by earlier copies
+    unchanged. by_index marks an index -> ID mapping (the index is the key
+    rather than the value).
+    """
+
+    __slots__ = ('_base', '_added', '_size', '_by_index')
+
+    def __init__(self, base, added, size, by_index):
+        self._base = base
+        self._added = added
+        self._size = size
+        self._by_index = by_index
+
+    @classmethod
+    def of(cls, mapping, by_index=False):
+        """Return mapping as a _GrowingMap, wrapping a plain dict without copying it"""
+        if isinstance(mapping, cls):
+            return mapping
+        return cls(mapping, {}, len(mapping), by_index)
+
+    def _visible(self, key, value):
+        return (key if self._by_index else value) < self._size
+
+    def added(self, key, value):
+        """Return a mapping with one more entry, whose index must equal the current size"""
+        if len(self._base) + len(self._added) == self._size:
+            added = self._added
+        else:
+            # Not the newest mapping: the shared entries past its size
+            # belong to another copy
+            added = {k: v for k, v in self._added.items() if self._visible(k, v)}
+        added[key] = value
+        return _GrowingMap(self._base, added, self._size + 1, self._by_index)
+
+    def __getitem__(self, key):
+        try:
+            return self._base[key]
+        except KeyError:
+            value = self._added[key]
+            if not self._visible(key, value):
+                raise
+            return value
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        yield from self._base
+        for key, value in list(self._added.items()):
+            if self._visible(key, value):
+                yield key
+
+    def __len__(self):
+        return self._size
+
+def _fold_in(factors, sigma, indices, centered):
+    """Project mean-centered ratings onto the latent space: r . F[indices] / sigma"""
+    if len(indices) == 0:
+        return np.zeros(factors.shape[1])
+
+    # Ignore numerically null singular values instead of dividing by them
+    inv_sigma = np.zeros_like(sigma)
+    np.divide(1.0, sigma, out=inv_sigma, where=sigma > 1e-10)
+
+    return np.dot(centered, factors[np.asarray(indices)]) * inv_sigma
+
+def _l2_normalize(factors):
+    """Scale each row to unit length, leaving all-zero rows at zero"""
+    norms = np.linalg.norm(factors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return factors / norms
+
+def _cosine_scores(normalized, idx):
+    """Cosine similarity of row idx against every row, excluding itself"""
+    # Compute cosine similarity with a single matrix-vector product
+    similarities = np.dot(normalized, normalized[idx])
+
+    # Set self-similarity to -inf to exclude from results
+    similarities[idx] = -np.inf
+
+    return similarities
+
+def _block_size(n_columns, memory_budget, n_jobs=1):
+    """Return the number of rows per scoring block that keeps n_jobs concurrent blocks within memory_budget bytes"""
+    # Each row of a block holds about three n_columns arrays of 8 bytes at
+    # once: its scores, their negation and the partition indices
+    return int(min(1024, max(1, memory_budget // (n_jobs * max(n_columns, 1) * 24))))
+
+def _build_neighbor_table(normalized, n_neighbors, memory_budget=256 * 2 ** 20):
+    """
+    Precompute the top neighbors of every row of a normalized factor matrix
+
+    Rows are scored in blocks whose size is derived from the memory budget,
+    so peak memory stays bounded however many rows there are.
+
+    Parameters:
+    -----------
+    normalized : numpy.ndarray
+        L2-normalized factor matrix
+    n_neighbors : int
+        Number of neighbors to keep per row
+    memory_budget : int
+        Bytes of scratch memory for one block of similarities
+
+    Returns:
+    --------
+    tuple
+        (indices, scores) arrays of shape (n_rows, depth)
+    """
+    n_rows = normalized.shape[0]
+    depth = min(n_neighbors, n_rows)
+    indices = np.empty((n_rows, depth), dtype=np.int32)
+    scores = np.empty((n_rows, depth), dtype=normalized.dtype)
+    block_size = _block_size(n_rows, memory_budget)
+
+    for start in range(0, n_rows, block_size):
+        stop = min(start + block_size, n_rows)
+        block = np.dot(normalized[start:stop], normalized.T)
+        block[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+
+        top_indices = top_k_batch(block, depth)
+        indices[start:stop] = top_indices
+        scores[start:stop] = np.take_along_axis(block, top_indices, axis=1)
+
+    return indices, scores
+
+def _most_similar(normalized, neighbors, index, idx, n_similar):
+    """Return the (index, similarity) pairs of the rows most similar to idx"""
+    # Serve from the precomputed neighbor table when it is deep enough
+    # (rows added by partial_fit since the last fit are not in the table)
+    if neighbors is not None and n_similar <= neighbors[0].shape[1] and idx < neighbors[0].shape[0]:
+        _SEARCHES.inc(labels=('similar', 'table'))
+        indices, scores = neighbors
+        return [(idx_, scores[idx, i]) for i, idx_ in enumerate(indices[idx, :n_similar])]
+
+    # Then from the approximate index, unless it returned too few candidates
+    if index is not None:
+        top_indices, scores = index.search(normalized[idx], n_similar, exclude=[idx])
+        if len(top_indices) == n_similar:
+            _SEARCHES.inc(labels=('similar', 'ann'))
+            return list(zip(top_indices, scores))
+        _SEARCHES.inc(labels=('similar', 'ann_fallback'))
+    else:
+        _SEARCHES.inc(labels=('similar', 'exact'))
+
+    similarities = _cosine_scores(normalized, idx)
+
+    # Get top N similar indices
+    top_indices = top_k(similarities, n_similar)
+
+    # Return as (idx, similarity) tuples
+    return [(i, similarities[i]) for i in top_indices]
+
+def train_recommender(n_neighbors=0, index_factory=None, n_top_recommendations=0):
+    """
+    Train the collaborative filtering recommender using the sample data
+
+    Parameters:
+    -----------
+    n_neighbors : int
+        Depth of the precomputed similar-user/similar-item tables (0 to disable)
+    index_factory : callable, optional
+        Factory for approximate nearest-neighbor indexes (None for exact search)
+    n_top_recommendations : int
+        Depth of the precomputed per-user top recommendation table (0 to disable)
+    """
+    # Create the rating matrix from one copy of the ratings: request threads
+    # keep appending to the list while a background refit runs
+    records = store.ratings[:]
+    n_ratings = len(records)
+    with _STAGE_SECONDS.time(('rating_matrix',)):
+        rating_matrix, user_to_idx, item_to_idx = create_rating_matrix(sparse=True, records=records)
 
     # Create inverse mappings
     idx_to_user = {idx: user_id for user_id, idx in user_to_idx.items()}
     idx_to_item = {idx: item_id for item_id, idx in item_to_idx.items()}
 
     # Initialize and train model
-    model = CollaborativeFilteringRecommender(n_factors=10)
+    model = CollaborativeFilteringRecommender(n_factors=10, n_neighbors=n_neighbors, index_factory=index_factory,
+                                              n_top_recommendations=n_top_recommendations)
     model.fit(rating_matrix)
 
     # Store mappings
@@ -175,21 +992,56 @@ def train_recommender():
     model.idx_to_user = idx_to_user
     model.idx_to_item = idx_to_item
 
+    # Ratings past this position arrived after training
+    model.n_ratings = n_ratings
+
     return model
 
+def publish_model(model, root):
+    """
+    Save a model as a new versioned artifact and make it the current one
+
+    The artifact is written to <root>/<version>/ and then <root>/CURRENT is
+    atomically replaced with the version name, so readers never see a
+    partially written artifact.
+
+    Parameters:
+    -----------
+    model : CollaborativeFilteringRecommender
+        The fitted model
+    root : str
+        Directory holding the versioned artifacts
+
+    Returns:
+    --------
+    str
+        The published version name
+    """
+    version = time.strftime('%Y%m%d-%H%M%S') + f"-{time.time_ns() % 1000000:06d}"
+    model.save(os.path.join(root, version))
+
+    tmp_path = os.path.join(root, 'CURRENT.tmp')
+    with open(tmp_path, 'w') as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(root, 'CURRENT'))
+
+    return version
+
+def current_model_path(root):
+    """Return the path of the current published artifact under root, or None"""
+    try:
+        with open(os.path.join(root, 'CURRENT')) as f:
+            return os.path.join(root, f.read().strip())
+    except FileNotFoundError:
+        return None
+
 def get_item_info(item_id):
     """Get item information by ID"""
-    for item in items:
-        if item["id"] == item_id:
-            return item
-    return None
+    return store.get_item(item_id)
 
 def get_user_info(user_id):
     """Get user information by ID"""
-    for user in users:
-        if user["id"] == user_id:
-            return user
-    return None
+    return store.get_user(user_id)
 
 def print_recommendations(model, user_id, n_recommendations=5):
     """Print recommendations for a user in a readable format"""
@@ -3,8 +3,10 @@ Sample data module for recommendation and sentiment analysis.
 """
 import json
 import os
+from collections import defaultdict
 from datetime import datetime, timedelta
 import numpy as np
+from scipy.sparse import csr_matrix
 
 # Define data structures
 users = [
@@ -357,6 +359,87 @@ ratings = [
     }
 ]
 
+class DataStore:
+    """In-memory users, items and ratings with ID indexes kept consistent on writes"""
+
+    def __init__(self, users, items, ratings):
+        """
+        Initialize the data store and build its indexes
+
+        Parameters:
+        -----------
+        users : list
+            User records (kept and served as-is)
+        items : list
+            Item records (kept and served as-is)
+        ratings : list
+            Rating records; new ratings must be added through add_rating
+        """
+        self.users = users
+        self.items = items
+        self.ratings = ratings
+        self.users_by_id = {user["id"]: user for user in users}
+        self.items_by_id = {item["id"]: item for item in items}
+        self.ratings_by_user = defaultdict(list)
+        self.ratings_by_item = defaultdict(list)
+        self.ratings_by_pair = {}
+
+        for rating in ratings:
+            self._index_rating(rating)
+
+    def _index_rating(self, rating):
+        """Add a rating to the per-user, per-item and (user, item) indexes"""
+        self.ratings_by_user[rating["userId"]].append(rating)
+        self.ratings_by_item[rating["itemId"]].append(rating)
+
+        # The most recent rating of a pair wins, as in the rating matrix
+        self.ratings_by_pair[(rating["userId"], rating["itemId"])] = rating
+
+    def load_ratings(self, ratings):
+        """Replace all ratings in place (the list object is shared) and rebuild the rating indexes"""
+        self.ratings[:] = ratings
+        self.ratings_by_user = defaultdict(list)
+        self.ratings_by_item = defaultdict(list)
+        self.ratings_by_pair = {}
+
+        for rating in self.ratings:
+            self._index_rating(rating)
+
+    def load(self, users, items, ratings):
+        """Replace all users, items and ratings in place and rebuild every index"""
+        self.users[:] = users
+        self.items[:] = items
+        self.users_by_id = {user["id"]: user for user in self.users}
+        self.items_by_id = {item["id"]: item for item in self.items}
+        self.load_ratings(ratings)
+
+    def add_rating(self, rating):
+        """Append a rating and index it"""
+        self.ratings.append(rating)
+        self._index_rating(rating)
+
+    def get_user(self, user_id):
+        """Get user information by ID (None if unknown)"""
+        return self.users_by_id.get(user_id)
+
+    def get_item(self, item_id):
+        """Get item information by ID (None if unknown)"""
+        return self.items_by_id.get(item_id)
+
+    def get_user_ratings(self, user_id):
+        """Get all ratings by a user"""
+        return self.ratings_by_user.get(user_id, [])
+
+    def get_item_ratings(self, item_id):
+        """Get all ratings of an item"""
+        return self.ratings_by_item.get(item_id, [])
+
+    def get_rating(self, user_id, item_id):
+        """Get a user's most recent rating of an item (None if unrated)"""
+        return self.ratings_by_pair.get((user_id, item_id))
+
+store = DataStore(users, items, ratings)
+
 def save_to_json():
     """Save the data to JSON files"""
     os.makedirs('data', exist_ok=True)
@@ -370,27 +453,79 @@ def save_to_json():
     with open('data/ratings.json', 'w') as f:
         json.dump(ratings, f, indent=2)
 
-def create_rating_matrix():
-    """Create a user-item rating matrix"""
+def create_rating_matrix(sparse=False, records=None):
+    """
+    Create a user-item rating matrix
+
+    Parameters:
+    -----------
+    sparse : bool
+        Whether to build a scipy.sparse CSR matrix instead of a dense array.
+        The sparse matrix only stores the observed ratings, so its memory
+        scales with the number of ratings rather than users x items.
+    records : list, optional
+        The rating records to use (defaults to all ratings). Pass a copy when
+        other threads may append ratings meanwhile.
+
+    Returns:
+    --------
+    tuple
+        (rating_matrix, user_to_idx, item_to_idx)
+    """
+    if records is None:
+        records = ratings
+
     # Get unique user and item IDs
-    user_ids = sorted(list({rating["userId"] for rating in ratings}))
-    item_ids = sorted(list({rating["itemId"] for rating in ratings}))
+    user_ids = sorted(list({rating["userId"] for rating in records}))
+    item_ids = sorted(list({rating["itemId"] for rating in records}))
 
     # Create mappings
     user_to_idx = {user_id: i for i, user_id in enumerate(user_ids)}
     item_to_idx = {item_id: i for i, item_id in enumerate(item_ids)}
 
+    if sparse:
+        rating_matrix = _build_sparse_rating_matrix(records, user_to_idx, item_to_idx)
+        return rating_matrix, user_to_idx, item_to_idx
+
     # Initialize matrix with zeros
     rating_matrix = np.zeros((len(user_ids), len(item_ids)))
 
     # Fill matrix with ratings
-    for rating in ratings:
+    for rating in records:
         user_idx = user_to_idx[rating["userId"]]
         item_idx = item_to_idx[rating["itemId"]]
         rating_matrix[user_idx, item_idx] = rating["rating"]
 
     return rating_matrix, user_to_idx, item_to_idx
 
+def _build_sparse_rating_matrix(records, user_to_idx, item_to_idx):
+    """Build a CSR rating matrix from rating records"""
+    n_ratings = len(records)
+    rows = np.empty(n_ratings, dtype=np.int64)
+    cols = np.empty(n_ratings, dtype=np.int64)
+    values = np.empty(n_ratings, dtype=np.float64)
+
+    for i, rating in enumerate(records):
+        rows[i] = user_to_idx[rating["userId"]]
+        cols[i] = item_to_idx[rating["itemId"]]
+        values[i] = rating["rating"]
+
+    # A user may rate the same item more than once; like the dense path,
+    # the most recent record wins (COO -> CSR would otherwise sum them)
+    keys = rows * len(item_to_idx) + cols
+    _, last = np.unique(keys[::-1], return_index=True)
+    keep = n_ratings - 1 - last
+
+    rating_matrix = csr_matrix(
+        (values[keep], (rows[keep], cols[keep])),
+        shape=(len(user_to_idx), len(item_to_idx))
+    )
+
+    # Zero means "not rated" in the dense matrix, so drop explicit zeros
+    rating_matrix.eliminate_zeros()
+
+    return rating_matrix
+
 if __name__ == "__main__":
     save_to_json()
     rating_matrix, _, _ = create_rating_matrix()
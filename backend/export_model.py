@@ -0,0 +1,23 @@
+"""
+Train the recommendation model on all stored ratings and publish it as an artifact
+"""
+import os
+import sys
+from data import ratings, store
+from ratings_log import RatingsLog
+from collaborative_filtering import train_recommender, publish_model
+
+if __name__ == "__main__":
+    # Artifacts are published under this directory (MODEL_DIR in app.py)
+    root = sys.argv[1] if len(sys.argv) > 1 else 'models'
+
+    # Load the same ratings the API serves
+    ratings_log = RatingsLog('data', default=ratings)
+    store.load_ratings(ratings_log.load())
+    ratings_log.close()
+
+    # Train and publish the model
+    # Precompute recommendation tables of the same depth the API uses
+    model = train_recommender(n_top_recommendations=int(os.environ.get('TOP_N_DEPTH', 0)))
+    version = publish_model(model, root)
+    print(f"Published model {version} to {root} ({len(ratings)} ratings, matrix shape {model.rating_matrix.shape})")
@@ -0,0 +1,40 @@
+"""
+Gunicorn configuration for serving the API in production.
+
+The app (and with it the recommendation model) is loaded once in the master
+process before the workers are forked, so every worker shares the model's
+memory copy-on-write instead of loading its own copy. Published artifacts
+are memory-mapped, so models reloaded later are shared through the page
+cache as well.
+
+Usage: gunicorn -c gunicorn.conf.py wsgi:app
+"""
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+
+# Worker processes and request threads per worker. Recommendations are
+# NumPy-bound and release the GIL, so a few threads per worker help.
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_class = 'gthread'
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+
+preload_app = True
+
+# Tell the app it is preloaded (background threads are started per worker
+# in post_fork) and stop workers from compacting the shared ratings log
+os.environ['PRELOADED_WORKERS'] = '1'
+os.environ.setdefault('RATINGS_COMPACT_EVERY', '0')
+
+def pre_fork(server, worker):
+    """Move the preloaded objects out of the GC's reach so collections in workers don't copy their pages"""
+    gc.freeze()
+
+def post_fork(server, worker):
+    """Start the background trainer and artifact watcher in the new worker"""
+    from app import start_background_threads
+    start_background_threads()
@@ -0,0 +1,247 @@
+"""
+In-process metrics exposed in the Prometheus text format.
+
+Counters, gauges and histograms are registered once at import time by the
+modules they instrument and rendered by the /metrics endpoint. Metrics are
+enabled with METRICS_ENABLED=1. When disabled, timed() leaves functions
+undecorated and every other metric method returns immediately, so
+instrumented hot paths cost close to nothing.
+
+Metrics are per process: under gunicorn every worker keeps its own, and
+work done in process pools (chart rendering, batch sentiment scoring) is
+timed from the parent.
+"""
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+
+ENABLED = os.environ.get('METRICS_ENABLED') == '1'
+
+# Default histogram buckets (seconds), from sub-millisecond lookups to full refits
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value):
+    """Escape a label value for the text format"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=()):
+    """Format label names and values as {a="x",b="y"} (empty string without labels)"""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value):
+    """Format a sample value"""
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    """Base class of the metric types: a name, help text and per-label-values state"""
+
+    type_name = None
+
+    def __init__(self, name, help, labelnames=(), enabled=True):
+        """
+        Initialize the metric
+
+        Parameters:
+        -----------
+        name : str
+            Metric name
+        help : str
+            Description shown in the # HELP line
+        labelnames : tuple of str
+            Names of the labels; values are passed positionally when updating
+        enabled : bool
+            Whether updates are recorded
+        """
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.enabled = enabled
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def render(self):
+        """Return the metric's lines in the text format"""
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.extend(self._samples(labels, value))
+        return lines
+
+    def _samples(self, labels, value):
+        """Return the sample lines of one label set"""
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"]
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    type_name = 'counter'
+
+    def inc(self, amount=1, labels=()):
+        """Increase the count of a label set"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+
+    type_name = 'gauge'
+
+    def set(self, value, labels=()):
+        """Set the value of a label set"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._values[labels] = value
+
+class _NullTimer:
+    """Context manager that does nothing, returned by timers of disabled histograms"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class _Timer:
+    """Context manager observing its duration into a histogram"""
+
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, self.labels)
+        return False
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), enabled=True, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames, enabled)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, labels=()):
+        """Record one value for a label set"""
+        if not self.enabled:
+            return
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # Per-bucket counts (the last one is +Inf), sum and count
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, labels=()):
+        """Return a context manager that observes the duration of its block"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, labels)
+
+    def _samples(self, labels, state):
+        bucket_counts, total, count = state
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), bucket_counts):
+            cumulative += bucket_count
+            le = _format_labels(self.labelnames, labels, [('le', _format_value(bound))])
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+        label_text = _format_labels(self.labelnames, labels)
+        lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+        lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+class Registry:
+    """Collection of named metrics"""
+
+    def __init__(self, enabled=True):
+        """
+        Initialize an empty registry
+
+        Parameters:
+        -----------
+        enabled : bool
+            Whether metrics created through the registry record updates
+        """
+        self.enabled = enabled
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def get_or_create(self, metric_type, name, help, labelnames=(), **kwargs):
+        """Return the metric registered under name, creating it if needed"""
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_type(name, help, labelnames, self.enabled, **kwargs)
+            elif not isinstance(metric, metric_type):
+                raise ValueError(f"Metric {name} is already registered as a {metric.type_name}")
+            return metric
+
+    def render(self):
+        """Return every metric in the Prometheus text format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+# Process-wide registry used by the helpers below and by /metrics
+REGISTRY = Registry(ENABLED)
+
+def counter(name, help, labelnames=()):
+    """Return the counter registered under name in the default registry"""
+    return REGISTRY.get_or_create(Counter, name, help, labelnames)
+
+def gauge(name, help, labelnames=()):
+    """Return the gauge registered under name in the default registry"""
+    return REGISTRY.get_or_create(Gauge, name, help, labelnames)
+
+def histogram(name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+    """Return the histogram registered under name in the default registry"""
+    return REGISTRY.get_or_create(Histogram, name, help, labelnames, buckets=buckets)
+
+def timed(histogram, labels=()):
+    """
+    Decorator observing the duration of every call into a histogram
+
+    Parameters:
+    -----------
+    histogram : Histogram
+        The histogram observed into. When it is disabled the function is
+        returned undecorated.
+    labels : tuple
+        Label values of the observations
+    """
+    def decorator(fn):
+        if not histogram.enabled:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, labels)
+        return wrapper
+    return decorator
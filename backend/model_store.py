@@ -0,0 +1,334 @@
+"""
+Versioned holder for the live recommendation model with background retraining.
+"""
+import copy
+import os
+import threading
+import time
+from collections import namedtuple
+
+# A view of the live model. Request handlers read ModelStore.current once
+# and use that snapshot for the whole request. New ratings are folded into a
+# shallow copy that replaces it, so the ID mappings, rating dicts and array
+# shapes of a snapshot never change under a reader. Snapshots are not
+# immutable, though: all copies share the factor arrays, and the rows of
+# existing users and items are refreshed in place. A reader of an older
+# snapshot may see those new vectors, and for a moment a factor row that
+# does not match its normalized row. The rows are refreshed whole, and a
+# refit or reload replaces the arrays.
+ModelSnapshot = namedtuple('ModelSnapshot', ['model', 'generation', 'updates'])
+
+def snapshot_version(snapshot):
+    """Return the public version string of a snapshot ('<generation>.<updates>')"""
+    return f"{snapshot.generation}.{snapshot.updates}"
+
+class ModelStore:
+    """Owns the current model, folds in new ratings and retrains it in the background"""
+
+    def __init__(self, train_fn, ratings, refit_threshold=100, debounce_seconds=2.0, max_delay_seconds=30.0,
+                 publish_fn=None, trainer_lock=None):
+        """
+        Initialize the model store
+
+        Parameters:
+        -----------
+        train_fn : callable
+            Zero-argument callable that trains and returns a new
+            CollaborativeFilteringRecommender from the current ratings
+        ratings : list
+            The append-only ratings list train_fn reads from
+        refit_threshold : int
+            Number of folded-in ratings after which a full refit is requested
+        debounce_seconds : float
+            Quiet period after the last refit request before training starts,
+            so a burst of writes triggers a single refit
+        max_delay_seconds : float
+            Maximum time between the first pending refit request and the start
+            of training, so a steady stream of writes cannot postpone the
+            refit forever
+        publish_fn : callable, optional
+            Called with each retrained model instead of installing it, e.g.
+            to publish it as an artifact that every process then loads.
+            Returns the snapshot it installed, if any.
+        trainer_lock : TrainerLock, optional
+            Lock electing the one process that runs the background trainer
+            when several share the ratings. The others never refit; they
+            retry the lock when they request a refit, so one of them takes
+            over if the trainer exits.
+        """
+        self.train_fn = train_fn
+        self.ratings = ratings
+        self.refit_threshold = refit_threshold
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.publish_fn = publish_fn
+        self.trainer_lock = trainer_lock
+        self.current = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._first_request = 0.0
+        self._last_request = 0.0
+        self._thread = None
+
+    @property
+    def version(self):
+        """Version string of the current model"""
+        return snapshot_version(self.current)
+
+    def start(self, initial_model=None, start_trainer=True):
+        """
+        Install the initial model and start the background trainer
+
+        Parameters:
+        -----------
+        initial_model : CollaborativeFilteringRecommender, optional
+            A pre-trained model, e.g. loaded from an artifact. Ratings stored
+            after it was trained are folded into it. When omitted, the
+            initial model is trained synchronously.
+        start_trainer : bool
+            Whether to start the background trainer now. Preforking servers
+            start it in each worker instead (see start_trainer).
+        """
+        if initial_model is None:
+            initial_model = self.train_fn()
+        elif initial_model.n_ratings is not None:
+            for rating in self.ratings[initial_model.n_ratings:]:
+                initial_model.partial_fit(rating['userId'], rating['itemId'], rating['rating'])
+
+        self.current = ModelSnapshot(initial_model, generation=1, updates=0)
+
+        if start_trainer:
+            self.start_trainer()
+        return self
+
+    def start_trainer(self):
+        """
+        Start the background trainer thread if it is not running in this process
+
+        Threads do not survive fork(), so a preforking server calls this in
+        every worker after the fork. With a trainer lock, the thread is only
+        started if this process holds (or can take) the lock.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if self.trainer_lock is not None and not self.trainer_lock.acquire():
+            return
+
+        self._thread = threading.Thread(target=self._run, name='model-trainer', daemon=True)
+        self._thread.start()
+
+    def add_rating(self, rating):
+        """
+        Fold a new rating into the current model
+
+        Parameters:
+        -----------
+        rating : dict
+            Rating record with userId, itemId and rating fields
+
+        Returns:
+        --------
+        ModelSnapshot
+            The snapshot that includes the rating
+        """
+        with self._lock:
+            # partial_fit replaces the containers it changes, so a shallow
+            # copy leaves the published model's mappings and shapes untouched
+            # (its shared factor rows are still refreshed; see ModelSnapshot)
+            snapshot = self.current
+            model = copy.copy(snapshot.model)
+            model.partial_fit(rating['userId'], rating['itemId'], rating['rating'])
+            self.current = snapshot._replace(model=model, updates=snapshot.updates + 1)
+
+            if model.n_updates >= self.refit_threshold:
+                self.request_refit()
+
+            return self.current
+
+    def request_refit(self):
+        """Ask the background trainer for a full refit (debounced)"""
+        now = time.monotonic()
+        if not self._wakeup.is_set():
+            self._first_request = now
+        self._last_request = now
+        self._wakeup.set()
+
+        # Take over as the trainer if the process that held the lock exited
+        if self.trainer_lock is not None:
+            self.start_trainer()
+
+    def refit(self):
+        """Train a new model from all ratings and swap it in atomically (or hand it to publish_fn)"""
+        model = self.train_fn()
+        if self.publish_fn is not None:
+            return self.publish_fn(model)
+        return self.install(model)
+
+    def install(self, new_model, ratings=None):
+        """
+        Swap in a newly trained model atomically
+
+        Parameters:
+        -----------
+        new_model : CollaborativeFilteringRecommender
+            The new model, e.g. freshly trained or loaded from an artifact
+        ratings : list, optional
+            The ratings list the model's n_ratings counts into. Defaults to
+            the store's ratings list.
+
+        Returns:
+        --------
+        ModelSnapshot
+            The snapshot of the new model
+        """
+        ratings = self.ratings if ratings is None else ratings
+
+        # Ratings are append-only, so everything past the ones the model was
+        # trained on arrived since and has to be folded in first
+        with self._lock:
+            if new_model.n_ratings is not None:
+                for rating in ratings[new_model.n_ratings:]:
+                    new_model.partial_fit(rating['userId'], rating['itemId'], rating['rating'])
+            self.current = ModelSnapshot(new_model, generation=self.current.generation + 1, updates=0)
+
+        return self.current
+
+    def _run(self):
+        """Background trainer loop"""
+        while True:
+            self._wakeup.wait()
+
+            # Wait until writes have been quiet for the debounce period, but
+            # no longer than max_delay_seconds after the first request
+            while True:
+                deadline = min(self._last_request + self.debounce_seconds,
+                               self._first_request + self.max_delay_seconds)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                time.sleep(remaining)
+
+            self._wakeup.clear()
+            try:
+                snapshot = self.refit()
+                if snapshot is not None:
+                    print(f"Recommendation model retrained (version {snapshot_version(snapshot)})")
+            except Exception as e:
+                print(f"Background retraining failed: {e}")
+
+class ArtifactWatcher:
+    """Polls for newly published model artifacts and installs them into a ModelStore"""
+
+    def __init__(self, model_store, resolve_path, load_model, load_ratings=None, interval=5.0, path=None):
+        """
+        Initialize the watcher
+
+        Parameters:
+        -----------
+        model_store : ModelStore
+            The store new models are installed into
+        resolve_path : callable
+            Zero-argument callable returning the current artifact path, or None
+        load_model : callable
+            Callable loading a model from an artifact path
+        load_ratings : callable, optional
+            Zero-argument callable returning the ratings the artifact's
+            n_ratings counts into (see ModelStore.install)
+        interval : float
+            Seconds between polls
+        path : str, optional
+            Path of the artifact that is already installed
+        """
+        self.model_store = model_store
+        self.resolve_path = resolve_path
+        self.load_model = load_model
+        self.load_ratings = load_ratings
+        self.interval = interval
+        self.path = path
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def check(self):
+        """
+        Install the current artifact if it changed since the last check
+
+        Returns:
+        --------
+        ModelSnapshot or None
+            The new snapshot, or None if the artifact did not change
+        """
+        # Called by the polling thread and by a trainer that just published
+        with self._lock:
+            path = self.resolve_path()
+            if path is None or path == self.path:
+                return None
+
+            model = self.load_model(path)
+            ratings = self.load_ratings() if self.load_ratings is not None else None
+            snapshot = self.model_store.install(model, ratings)
+            self.path = path
+            return snapshot
+
+    def start(self):
+        """Start polling in a background thread if it is not running in this process"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._thread = threading.Thread(target=self._run, name='artifact-watcher', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        """Background polling loop"""
+        while True:
+            time.sleep(self.interval)
+            try:
+                snapshot = self.check()
+                if snapshot is not None:
+                    print(f"Recommendation model reloaded from {self.path} (version {snapshot_version(snapshot)})")
+            except Exception as e:
+                print(f"Loading model artifact failed: {e}")
+
+class TrainerLock:
+    """Non-blocking exclusive lock on a file, held by at most one process until it exits"""
+
+    def __init__(self, path):
+        """
+        Initialize the lock
+
+        Parameters:
+        -----------
+        path : str
+            Lock file, created if missing
+        """
+        self.path = path
+        self._file = None
+        self._pid = None
+
+    def acquire(self):
+        """
+        Take the lock if no other process holds it
+
+        Returns:
+        --------
+        bool
+            Whether this process holds the lock
+        """
+        # flock is POSIX-only, like the preforking servers that elect a trainer
+        import fcntl
+
+        if self._pid == os.getpid():
+            return True
+
+        # Open the file in this process: a lock taken through a descriptor
+        # inherited across fork() would be shared with the parent
+        f = open(self.path, 'a')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+
+        # Keep the file open: the lock is released when the process exits
+        self._file = f
+        self._pid = os.getpid()
+        return True
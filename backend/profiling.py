@@ -0,0 +1,189 @@
+"""
+Opt-in profiling of individual API requests.
+
+A request asks to be profiled with the X-Profile header or the ?profile=
+query flag. Profiling must also be enabled on the server (PROFILING_ENABLED=1
+in app.py) and is rate limited. The handler runs under cProfile and the
+profile is stored on disk for download, as a pstats file for tools such as
+snakeviz or as a text report.
+
+Only one request per process is profiled at a time. On Python 3.12+ cProfile
+hooks every thread, so calls from requests served concurrently in other
+threads can show up in a profile.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import uuid
+from collections import deque
+
+class RequestProfiler:
+    """Profiles flagged requests with cProfile and stores the results"""
+
+    def __init__(self, directory='profiles', max_per_minute=6, max_profiles=100, token=None):
+        """
+        Initialize the profiler
+
+        Parameters:
+        -----------
+        directory : str
+            Directory the profiles are stored in (shared by all workers)
+        max_per_minute : int
+            Maximum number of profiles captured per minute by this process
+        max_profiles : int
+            Number of stored profiles kept; the oldest are deleted
+        token : str, optional
+            When set, the flag's value must equal it, so only callers that
+            know the token can trigger profiling
+        """
+        self.directory = directory
+        self.max_per_minute = max_per_minute
+        self.max_profiles = max_profiles
+        self.token = token
+        self._recent = deque()
+        self._lock = threading.Lock()
+        # Only one cProfile profiler can be active at a time in a process
+        self._active = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+
+    def requested(self, flag):
+        """Return whether a request's X-Profile header or ?profile= value asks for profiling"""
+        if not flag:
+            return False
+        if self.token:
+            return flag == self.token
+        return flag.lower() in ('1', 'true', 'yes')
+
+    def authorized(self, flag):
+        """Return whether a request may read stored profiles (it must carry the token, if one is set)"""
+        return not self.token or flag == self.token
+
+    def start(self):
+        """
+        Start profiling the current request, subject to the rate limit
+
+        Returns:
+        --------
+        cProfile.Profile or None
+            The running profiler, or None if the request is not profiled
+            (rate limit reached or another request is being profiled)
+        """
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and now - self._recent[0] > 60:
+                self._recent.popleft()
+            if len(self._recent) >= self.max_per_minute:
+                return None
+            if not self._active.acquire(blocking=False):
+                return None
+            self._recent.append(now)
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiling tool is active in this process
+            self._active.release()
+            return None
+        return profile
+
+    def stop(self, profile):
+        """Stop a profiler returned by start() without saving it"""
+        profile.disable()
+        self._active.release()
+
+    def finish(self, profile, info):
+        """
+        Stop a profiler returned by start() and store its profile
+
+        Parameters:
+        -----------
+        profile : cProfile.Profile
+            The running profiler
+        info : dict
+            Request details saved with the profile (method, path, status, ...)
+
+        Returns:
+        --------
+        str
+            The profile ID
+        """
+        self.stop(profile)
+
+        # Sortable by time; the random suffix keeps IDs from workers distinct
+        now = time.time()
+        profile_id = (time.strftime('%Y%m%d-%H%M%S', time.localtime(now))
+                      + f"-{int(now * 1e6) % 1000000:06d}-{uuid.uuid4().hex[:6]}")
+        profile.dump_stats(os.path.join(self.directory, f"{profile_id}.prof"))
+        with open(os.path.join(self.directory, f"{profile_id}.json"), 'w') as f:
+            json.dump(dict(info, id=profile_id, created=time.time()), f)
+
+        self._prune()
+        return profile_id
+
+    def _prune(self):
+        """Delete the oldest profiles beyond max_profiles"""
+        profile_ids = self.list_ids()
+        for profile_id in profile_ids[:max(0, len(profile_ids) - self.max_profiles)]:
+            for extension in ('.json', '.prof'):
+                try:
+                    os.remove(os.path.join(self.directory, profile_id + extension))
+                except FileNotFoundError:
+                    pass
+
+    def list_ids(self):
+        """Return the stored profile IDs, oldest first"""
+        return sorted(name[:-len('.json')] for name in os.listdir(self.directory) if name.endswith('.json'))
+
+    def list_profiles(self):
+        """Return the details of every stored profile, newest first"""
+        profiles = []
+        for profile_id in reversed(self.list_ids()):
+            info = self.info(profile_id)
+            if info is not None:
+                profiles.append(info)
+        return profiles
+
+    def info(self, profile_id):
+        """Return the details stored with a profile, or None if it does not exist"""
+        try:
+            with open(os.path.join(self.directory, f"{os.path.basename(profile_id)}.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def path(self, profile_id):
+        """Return the path of a profile's pstats file, or None if it does not exist"""
+        path = os.path.join(self.directory, f"{os.path.basename(profile_id)}.prof")
+        return path if os.path.exists(path) else None
+
+    def report(self, profile_id, sort='cumulative', limit=50):
+        """
+        Render a stored profile as text
+
+        Parameters:
+        -----------
+        profile_id : str
+            The profile ID
+        sort : str
+            pstats sort key ('cumulative', 'tottime', 'calls', ...)
+        limit : int
+            Number of functions listed
+
+        Returns:
+        --------
+        str or None
+            The pstats report, or None if the profile does not exist
+        """
+        path = self.path(profile_id)
+        if path is None:
+            return None
+
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+        return out.getvalue()
@@ -0,0 +1,89 @@
+"""
+Top-K selection utilities shared by the ranking paths.
+
+Selecting K winners with argpartition is O(N) instead of the O(N log N) of a
+full argsort; only the K winners are then sorted. Ties are broken by the
+lower index first so results are deterministic.
+"""
+import numpy as np
+
+def top_k(scores, k):
+    """
+    Select the indices of the k highest scores
+
+    Parameters:
+    -----------
+    scores : numpy.ndarray
+        1-D array of scores
+    k : int
+        Number of indices to select
+
+    Returns:
+    --------
+    numpy.ndarray
+        Up to k indices sorted by descending score, ties by ascending index
+    """
+    scores = np.asarray(scores)
+    n = scores.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+
+        # argpartition keeps an arbitrary subset of a tie that straddles the
+        # k-th place; replace it with the lowest-indexed tied entries
+        kth = scores[candidates].min()
+        if np.count_nonzero(scores >= kth) > k:
+            above = np.flatnonzero(scores > kth)
+            ties = np.flatnonzero(scores == kth)[:k - len(above)]
+            candidates = np.concatenate([above, ties])
+    else:
+        candidates = np.arange(n)
+
+    # Sort only the winners: descending score, then ascending index
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order]
+
+def top_k_batch(scores, k):
+    """
+    Select the indices of the k highest scores in every row of a matrix
+
+    Parameters:
+    -----------
+    scores : numpy.ndarray
+        2-D array of scores, one ranking per row
+    k : int
+        Number of indices to select per row
+
+    Returns:
+    --------
+    numpy.ndarray
+        Array of shape (n_rows, min(k, n_columns)) with each row's indices
+        sorted by descending score, ties by ascending index
+    """
+    scores = np.asarray(scores)
+    n_rows, n = scores.shape
+    k = min(k, n)
+    if k <= 0:
+        return np.empty((n_rows, 0), dtype=np.intp)
+
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.tile(np.arange(n), (n_rows, 1))
+
+    # Sort only the winners of each row: descending score, then ascending index
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.lexsort((candidates, -candidate_scores), axis=1)
+    candidates = np.take_along_axis(candidates, order, axis=1)
+
+    # Rows with a tie straddling the k-th place are redone one at a time
+    if k < n:
+        kth = np.take_along_axis(scores, candidates[:, -1:], axis=1)
+        tied_rows = np.flatnonzero(np.count_nonzero(scores >= kth, axis=1) > k)
+        for row in tied_rows:
+            candidates[row] = top_k(scores[row], k)
+
+    return candidates
@@ -0,0 +1,377 @@
+"""
+Append-only, durable storage for ratings.
+
+New ratings are appended to a JSON Lines log instead of rewriting
+ratings.json on every write. The log is fsynced in batches and
+periodically compacted into the ratings.json snapshot; on startup the
+snapshot is loaded and the log replayed on top of it. Records are
+validated before they are appended and again when they are replayed, so a
+malformed record can never stop the server from starting.
+"""
+import json
+import math
+import os
+import threading
+import time
+
+# Range of valid rating values
+MIN_RATING = 1
+MAX_RATING = 5
+
+def _is_int(value):
+    """Return whether a JSON value is an integer (booleans are not)"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _is_number(value):
+    """Return whether a JSON value is a finite number (booleans are not)"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+def validate_rating(rating):
+    """
+    Check a rating record before it is stored or replayed
+
+    Parameters:
+    -----------
+    rating : dict
+        The rating record
+
+    Returns:
+    --------
+    str or None
+        Description of the first problem found, or None if the record is valid
+    """
+    if not isinstance(rating, dict):
+        return "Rating must be a JSON object"
+    for field in ('userId', 'itemId'):
+        if not _is_int(rating.get(field)):
+            return f"{field} must be an integer"
+    if not _is_number(rating.get('rating')) or not MIN_RATING <= rating['rating'] <= MAX_RATING:
+        return f"rating must be a number between {MIN_RATING} and {MAX_RATING}"
+    if not isinstance(rating.get('review', ''), str):
+        return "review must be a string"
+    if 'timestamp' in rating and not _is_number(rating['timestamp']):
+        return "timestamp must be a number"
+    return None
+
+class RatingsLog:
+    """JSON Lines ratings log with batched fsync, compaction and replay"""
+
+    def __init__(self, directory='data', default=None, fsync_every=64, fsync_interval=1.0, compact_every=10000):
+        """
+        Open (or create) the ratings log
+
+        Parameters:
+        -----------
+        directory : str
+            Directory holding the ratings.json snapshot and ratings.log.jsonl
+        default : list, optional
+            Records to start from while no snapshot exists yet
+        fsync_every : int
+            Maximum number of appended records between fsyncs
+        fsync_interval : float
+            Maximum number of seconds a record stays pending before a
+            background thread fsyncs it. A crash loses at most the records
+            appended since the last fsync.
+        compact_every : int
+            Number of log records after which the log is compacted into the
+            snapshot in a background thread. 0 disables automatic compaction,
+            e.g. when several processes append to the same log.
+        """
+        self.snapshot_path = os.path.join(directory, 'ratings.json')
+        self.log_path = os.path.join(directory, 'ratings.log.jsonl')
+        # The log being folded into the snapshot by a running compaction
+        self.rotated_path = self.log_path + '.compacting'
+        self.default = list(default or [])
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        # Serializes compactions, and replays against compactions
+        self._compact_lock = threading.Lock()
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._compacting = False
+        self._flusher = None
+        self._closed = threading.Event()
+
+        os.makedirs(directory, exist_ok=True)
+        self.log_records = self._repair()
+        self._file = open(self.log_path, 'ab', buffering=0)
+
+        # Finish a compaction interrupted by a crash
+        if os.path.exists(self.rotated_path):
+            with self._compact_lock:
+                self._write_snapshot()
+
+    def _repair(self):
+        """Drop a torn trailing record left by a crash and return the record count"""
+        if not os.path.exists(self.log_path):
+            return 0
+
+        with open(self.log_path, 'rb+') as f:
+            content = f.read()
+            end = content.rfind(b'\n') + 1
+            if end != len(content):
+                f.truncate(end)
+        return content.count(b'\n')
+
+    def append(self, rating):
+        """
+        Append a rating record to the log
+
+        Parameters:
+        -----------
+        rating : dict
+            The rating record
+        """
+        line = (json.dumps(rating, separators=(',', ':')) + '\n').encode('utf-8')
+
+        with self._lock:
+            # One unbuffered write per record: appends from several processes
+            # sharing the log never interleave
+            self._file.write(line)
+            self._pending += 1
+            self.log_records += 1
+
+            # Batch fsyncs by count and by time; the flusher thread syncs
+            # records left pending when writes stop
+            if self._pending >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+            elif self._flusher is None or not self._flusher.is_alive():
+                # Threads don't survive a fork, so (re)start it on demand
+                self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+                self._flusher.start()
+
+            if self.compact_every and self.log_records >= self.compact_every and not self._compacting:
+                self._compacting = True
+                threading.Thread(target=self.compact, daemon=True).start()
+
+    def _sync(self):
+        """fsync the log (call with the lock held)"""
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def sync(self):
+        """Flush and fsync all pending records"""
+        with self._lock:
+            if self._pending and not self._file.closed:
+                self._sync()
+
+    def _flush_loop(self):
+        """fsync pending records every fsync_interval seconds until closed"""
+        while not self._closed.wait(self.fsync_interval):
+            self.sync()
+
+    @staticmethod
+    def _parse_line(line):
+        """Parse one log line (None if it is not valid JSON; validation skips it)"""
+        try:
+            return json.loads(line)
+        except json.JSONDecodeError:
+            return None
+
+    @classmethod
+    def _read_log(cls, path, offset=0):
+        """
+        Read the complete records of a log file past a byte offset
+
+        Returns:
+        --------
+        tuple
+            (records, end) where end is the byte offset after the last
+            complete record; a trailing line another process is still
+            writing is skipped. No records if the file does not exist.
+        """
+        if not os.path.exists(path):
+            return [], offset
+        with open(path, 'rb') as f:
+            return cls._read_records(f, offset)
+
+    @classmethod
+    def _read_records(cls, f, offset):
+        """Read the complete records of an open log file past a byte offset (see _read_log)"""
+        f.seek(offset)
+        content = f.read()
+        end = content.rfind(b'\n') + 1
+        records = [cls._parse_line(line) for line in content[:end].split(b'\n') if line.strip()]
+        return records, offset + end
+
+    def load(self):
+        """
+        Replay the stored ratings
+
+        Records that fail validate_rating are skipped with a warning.
+
+        Returns:
+        --------
+        list
+            The snapshot records (or the defaults) followed by the log records
+        """
+        return self.replay()[0]
+
+    def replay(self):
+        """
+        Replay the stored ratings and return where the log ends
+
+        Returns:
+        --------
+        tuple
+            (records, offset): the valid records as returned by load() and
+            the byte offset in the log after the last one, from which a
+            RatingsLogTailer picks up records appended later
+        """
+        with self._compact_lock:
+            log_records, offset = self._read_log(self.log_path)
+            records = self._load_compacted() + log_records
+
+        valid = [record for record in records if validate_rating(record) is None]
+        if len(valid) != len(records):
+            print(f"Skipped {len(records) - len(valid)} invalid rating records while replaying {self.log_path}")
+        return valid, offset
+
+    def _load_compacted(self):
+        """Return the snapshot records followed by the rotated log's (call with the compaction lock held)"""
+        # The rotated log is read before the snapshot: a compaction deletes it
+        # only after the new snapshot containing it is in place
+        rotated_records, _ = self._read_log(self.rotated_path)
+
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding='utf-8') as f:
+                records = json.load(f)
+        else:
+            records = list(self.default)
+
+        # A crash between writing a snapshot and deleting the rotated log
+        # leaves its records at the end of the snapshot; don't replay them twice
+        if rotated_records and records[-len(rotated_records):] != rotated_records:
+            records = records + rotated_records
+        return records
+
+    def compact(self):
+        """
+        Fold the log into a new snapshot and start a new log
+
+        Appends only wait for the log to be rotated; the snapshot is
+        rewritten without blocking them.
+        """
+        try:
+            with self._compact_lock:
+                # A rotated log left by a failed compaction is folded in first
+                if os.path.exists(self.rotated_path):
+                    self._write_snapshot()
+
+                with self._lock:
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                    self._file.close()
+                    os.replace(self.log_path, self.rotated_path)
+                    self._file = open(self.log_path, 'ab', buffering=0)
+                    self._pending = 0
+                    self.log_records = 0
+
+                self._write_snapshot()
+        finally:
+            self._compacting = False
+
+    def _write_snapshot(self):
+        """Fold the rotated log into the snapshot and delete it (call with the compaction lock held)"""
+        records = [record for record in self._load_compacted() if validate_rating(record) is None]
+
+        # Write the snapshot atomically: a crash leaves either the old
+        # snapshot or the new one, and _load_compacted() skips a rotated log
+        # that the new snapshot already contains
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(records, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        os.remove(self.rotated_path)
+
+    def close(self):
+        """Sync and close the log"""
+        self._closed.set()
+        self.sync()
+        with self._lock:
+            self._file.close()
+
+class RatingsLogTailer:
+    """Applies the records appended to a ratings log shared by several processes"""
+
+    def __init__(self, log_path, offset, apply):
+        """
+        Initialize the tailer
+
+        Parameters:
+        -----------
+        log_path : str
+            Path of the shared ratings.log.jsonl. When a compaction rotates
+            it, the rest of the rotated log is applied before the new log.
+        offset : int
+            Byte offset up to which the log has already been applied
+            (see RatingsLog.replay)
+        apply : callable
+            Called with every new valid record, in log order
+        """
+        self.log_path = log_path
+        self.offset = offset
+        self.apply = apply
+        self._lock = threading.Lock()
+        # The log file the offset points into, opened on the first poll (in
+        # the process that tails it) and kept open so that it can still be
+        # read after a compaction renames or deletes it
+        self._file = None
+        self._inode = None
+
+    def poll(self):
+        """
+        Apply the records appended since the last poll
+
+        Returns:
+        --------
+        int
+            Number of records applied
+        """
+        # A stat() is all an idle poll costs
+        try:
+            stat = os.stat(self.log_path)
+            if stat.st_ino == self._inode and stat.st_size <= self.offset:
+                return 0
+        except FileNotFoundError:
+            pass
+
+        with self._lock:
+            applied = 0
+            try:
+                inode = os.stat(self.log_path).st_ino
+            except FileNotFoundError:
+                inode = None
+
+            if self._file is not None and inode != self._inode:
+                # The log was rotated: finish the old file, then start the
+                # new one from its beginning
+                records, _ = RatingsLog._read_records(self._file, self.offset)
+                applied += self._apply(records)
+                self._file.close()
+                self._file = None
+                self.offset = 0
+
+            if self._file is None:
+                try:
+                    self._file = open(self.log_path, 'rb')
+                except FileNotFoundError:
+                    return applied
+                self._inode = os.fstat(self._file.fileno()).st_ino
+
+            records, self.offset = RatingsLog._read_records(self._file, self.offset)
+            return applied + self._apply(records)
+
+    def _apply(self, records):
+        """Apply the valid records and return how many there were"""
+        applied = 0
+        for record in records:
+            if validate_rating(record) is None:
+                self.apply(record)
+                applied += 1
+        return applied
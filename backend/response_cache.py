@@ -0,0 +1,116 @@
+"""
+In-process cache of serialized API responses tied to the model version.
+
+Responses of the recommendation and similarity endpoints only change when
+the model does, so they are cached per (endpoint, ID, n) for the current
+model version. Every new version (a folded-in rating or a refit) empties
+the cache. Each entry carries an ETag so clients and CDNs can revalidate
+with If-None-Match and receive a 304 instead of the body.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import metrics
+
+CachedResponse = namedtuple('CachedResponse', ['body', 'etag', 'expires'])
+
+_LOOKUPS = metrics.counter('response_cache_total', "Response cache lookups by endpoint and result",
+                           ['endpoint', 'result'])
+
+class ResponseCache:
+    """Bounded LRU cache of response bodies with a TTL, emptied when the model version changes"""
+
+    def __init__(self, max_size=10000, ttl=300.0):
+        """
+        Initialize the cache
+
+        Parameters:
+        -----------
+        max_size : int
+            Maximum number of cached responses (0 disables caching)
+        ttl : float
+            Seconds a response stays cached even if the model does not change
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def etag(body):
+        """Return the ETag of a response body"""
+        return hashlib.sha1(body).hexdigest()[:20]
+
+    def _check_version(self, version):
+        """Empty the cache if the model version changed (call with the lock held)"""
+        if version != self.version:
+            self._entries.clear()
+            self.version = version
+
+    def get(self, key, version):
+        """
+        Return the cached response for a key, or None
+
+        Parameters:
+        -----------
+        key : tuple
+            (endpoint, ID, n)
+        version : str
+            Version of the model the caller is serving from
+
+        Returns:
+        --------
+        CachedResponse or None
+        """
+        if not self.max_size:
+            return None
+
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        _LOOKUPS.inc(labels=(key[0], 'hit' if entry is not None else 'miss'))
+        return entry
+
+    def put(self, key, version, body):
+        """
+        Cache a response body
+
+        Parameters:
+        -----------
+        key : tuple
+            (endpoint, ID, n)
+        version : str
+            Version of the model the response was computed from
+        body : bytes
+            The serialized response
+
+        Returns:
+        --------
+        CachedResponse
+            The entry (also returned when caching is disabled)
+        """
+        entry = CachedResponse(body, self.etag(body), time.monotonic() + self.ttl)
+        if not self.max_size:
+            return entry
+
+        with self._lock:
+            # Entries always belong to the cache's current version; a response
+            # computed from a model that was replaced meanwhile is not cached
+            if version == self.version:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def __len__(self):
+        return len(self._entries)
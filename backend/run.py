@@ -3,7 +3,6 @@ Simple script to run the recommendation and sentiment analysis backend
 """
 import os
 from data import save_to_json
-from app import app
 
 if __name__ == "__main__":
     # Create data files if they don't exist
@@ -11,6 +10,11 @@ if __name__ == "__main__":
         print("Initializing data...")
         save_to_json()
 
+    # Imported here rather than at the top: multiprocessing children (the
+    # chart renderers) re-import this script and must not start the app
+    from app import app
+
     # Run the Flask app
     print("Starting recommendation and sentiment analysis API...")
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Development server; use gunicorn.conf.py in production
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get('FLASK_DEBUG') == '1')
@@ -1,40 +1,92 @@
 """
 Sentiment Analysis module for analyzing user reviews.
 """
-import nltk
-import numpy as np
-import pandas as pd
-from nltk.sentiment import SentimentIntensityAnalyzer
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
 import re
-from collections import Counter
-from data import ratings, items
-import matplotlib.pyplot as plt
-import seaborn as sns
-
-# Download necessary NLTK resources
-try:
-    nltk.data.find('tokenizers/punkt')
-    nltk.data.find('sentiment/vader_lexicon.zip')
-    nltk.data.find('corpora/stopwords')
-    nltk.data.find('corpora/wordnet')
-except LookupError:
-    nltk.download('punkt')
-    nltk.download('vader_lexicon')
-    nltk.download('stopwords')
-    nltk.download('wordnet')
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import Counter, OrderedDict
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from data import store
+from aspect_mining import AspectIndex
+from sentiment_charts import draw_sentiment_chart, render_sentiment_chart
+import metrics
+
+# Instrumentation (see metrics.py). Reviews scored in worker processes by
+# score_reviews are only counted in its overall duration
+_STAGE_SECONDS = metrics.histogram('sentiment_stage_seconds', "Time spent in sentiment analysis stages", ['stage'])
+_CACHE_LOOKUPS = metrics.counter('sentiment_review_cache_total', "Review sentiment cache lookups by result",
+                                 ['result'])
+
+def _load_nltk_resources():
+    """Import NLTK and download the resources the analyzer needs if missing"""
+    import nltk
+
+    try:
+        nltk.data.find('tokenizers/punkt')
+        nltk.data.find('sentiment/vader_lexicon.zip')
+        nltk.data.find('corpora/stopwords')
+        nltk.data.find('corpora/wordnet')
+    except LookupError:
+        nltk.download('punkt')
+        nltk.download('vader_lexicon')
+        nltk.download('stopwords')
+        nltk.download('wordnet')
+
+# Punctuation and digits, stripped from reviews in a single pass
+_STRIP_PATTERN = re.compile(r'[^\w\s]|\d')
 
 class SentimentAnalyzer:
     """Sentiment analysis for product reviews"""
 
-    def __init__(self):
-        """Initialize the sentiment analyzer"""
+    def __init__(self, tokenizer='treebank', lemma_cache_size=65536):
+        """
+        Initialize the sentiment analyzer
+
+        Parameters:
+        -----------
+        tokenizer : str
+            'treebank' tokenizes like nltk.word_tokenize (the same tokens,
+            without its sentence-splitting pass, which is a no-op once
+            punctuation is stripped). 'regex' splits on whitespace in a
+            single pass; it is faster but does not split the few
+            contractions Treebank knows without apostrophes ('cannot',
+            'gonna', 'wanna', ...).
+        lemma_cache_size : int
+            Number of distinct words whose lemma is memoized
+        """
+        if tokenizer not in ('treebank', 'regex'):
+            raise ValueError(f"Unknown tokenizer: {tokenizer}")
+
+        # NLTK takes seconds to import, so it is only loaded by an analyzer
+        _load_nltk_resources()
+        from nltk.sentiment import SentimentIntensityAnalyzer
+        from nltk.tokenize import NLTKWordTokenizer
+        from nltk.corpus import stopwords
+        from nltk.stem import WordNetLemmatizer
+
         self.sia = SentimentIntensityAnalyzer()
         self.lemmatizer = WordNetLemmatizer()
         self.stop_words = set(stopwords.words('english'))
+        self.tokenizer = tokenizer
+        self._word_tokenizer = NLTKWordTokenizer()
+        self._lemmatize = lru_cache(maxsize=lemma_cache_size)(self.lemmatizer.lemmatize)
 
+    def warm_up(self):
+        """
+        Force NLTK's lazily loaded resources (WordNet, tokenizer models) to load
+
+        The first lemmatize/tokenize call loads corpora on demand, which is
+        not thread-safe; running one analysis up front makes the analyzer
+        safe to share between request threads.
+        """
+        self.analyze_review("Warm up the sentiment analyzer with a short review.")
+        return self
+
+    @metrics.timed(_STAGE_SECONDS, ('preprocess',))
     def preprocess_text(self, text):
         """
         Preprocess text for analysis
@@ -49,24 +101,57 @@ class SentimentAnalyzer:
         list
             List of preprocessed tokens
         """
-        # Convert to lowercase
-        text = text.lower()
-
-        # Remove punctuation and numbers
-        text = re.sub(r'[^\w\s]', '', text)
-        text = re.sub(r'\d+', '', text)
+        # Convert to lowercase and remove punctuation and numbers
+        text = _STRIP_PATTERN.sub('', text.lower())
 
         # Tokenize
-        tokens = word_tokenize(text)
+        if self.tokenizer == 'regex':
+            tokens = text.split()
+        else:
+            tokens = self._word_tokenizer.tokenize(text)
 
-        # Remove stopwords
-        tokens = [token for token in tokens if token not in self.stop_words]
+        # Remove stopwords and lemmatize
+        stop_words = self.stop_words
+        lemmatize = self._lemmatize
+        return [lemmatize(token) for token in tokens if token not in stop_words]
 
-        # Lemmatize
-        tokens = [self.lemmatizer.lemmatize(token) for token in tokens]
+    def iter_preprocess(self, texts):
+        """
+        Preprocess a stream of texts lazily
 
-        return tokens
+        Parameters:
+        -----------
+        texts : iterable of str
+            The texts to preprocess
+
+        Yields:
+        -------
+        list
+            The preprocessed tokens of each text, in order
+        """
+        for text in texts:
+            yield self.preprocess_text(text)
 
+    def iter_aspects(self, texts, n=5):
+        """
+        Extract aspects from a stream of texts lazily
+
+        Parameters:
+        -----------
+        texts : iterable of str
+            The texts to analyze
+        n : int
+            Number of aspects to extract per text
+
+        Yields:
+        -------
+        list
+            The most frequent aspects of each text, as extract_aspects returns them
+        """
+        for text in texts:
+            yield self.extract_aspects(text, n)
+
+    @metrics.timed(_STAGE_SECONDS, ('vader',))
     def get_sentiment(self, text):
         """
         Get sentiment scores for text
@@ -97,7 +182,23 @@ class SentimentAnalyzer:
         str
             Sentiment classification ('positive', 'negative', or 'neutral')
         """
-        scores = self.get_sentiment(text)
+        return self.classify_scores(self.get_sentiment(text))
+
+    @staticmethod
+    def classify_scores(scores):
+        """
+        Classify already computed sentiment scores
+
+        Parameters:
+        -----------
+        scores : dict
+            Sentiment scores from get_sentiment
+
+        Returns:
+        --------
+        str
+            Sentiment classification ('positive', 'negative', or 'neutral')
+        """
         compound = scores['compound']
 
         if compound >= 0.05:
@@ -107,6 +208,7 @@ class SentimentAnalyzer:
         else:
             return 'neutral'
 
+    @metrics.timed(_STAGE_SECONDS, ('aspects',))
     def extract_aspects(self, text, n=5):
         """
         Extract the most frequent aspects (nouns) from text
@@ -132,7 +234,62 @@ class SentimentAnalyzer:
         # Return the n most common words
         return [word for word, _ in counter.most_common(n)]
 
-    def analyze_reviews(self, reviews):
+    @metrics.timed(_STAGE_SECONDS, ('analyze_review',))
+    def analyze_review(self, review):
+        """
+        Analyze a single review
+
+        Parameters:
+        -----------
+        review : str
+            The review text
+
+        Returns:
+        --------
+        dict
+            The review text, sentiment scores, classification and aspects
+        """
+        # Score once and classify from the same scores
+        sentiment = self.get_sentiment(review)
+
+        return {
+            'text': review,
+            'sentiment': sentiment,
+            'classification': self.classify_scores(sentiment),
+            'aspects': self.extract_aspects(review)
+        }
+
+    @metrics.timed(_STAGE_SECONDS, ('score_reviews',))
+    def score_reviews(self, reviews, n_jobs=1, chunk_size=500):
+        """
+        Analyze a batch of reviews, optionally in parallel processes
+
+        Parameters:
+        -----------
+        reviews : list
+            List of review strings
+        n_jobs : int
+            Number of worker processes; 1 scores in this process and -1
+            uses every CPU
+        chunk_size : int
+            Number of reviews sent to a worker at a time
+
+        Returns:
+        --------
+        list
+            analyze_review results, in input order
+        """
+        if n_jobs == -1:
+            n_jobs = os.cpu_count() or 1
+
+        if n_jobs <= 1 or len(reviews) <= chunk_size:
+            return [self.analyze_review(review) for review in reviews]
+
+        chunks = [reviews[i:i + chunk_size] for i in range(0, len(reviews), chunk_size)]
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=get_analyzer) as executor:
+            return [result for chunk in executor.map(_score_chunk, chunks) for result in chunk]
+
+    def analyze_reviews(self, reviews, cache=None):
         """
         Analyze multiple reviews and return aggregated sentiment
 
@@ -140,49 +297,283 @@ class SentimentAnalyzer:
         -----------
         reviews : list
             List of review strings
+        cache : ReviewSentimentCache, optional
+            Cache of per-review results; only reviews missing from it are scored
 
         Returns:
         --------
         dict
             Dictionary with aggregated sentiment analysis results
         """
-        results = []
-        for review in reviews:
-            sentiment = self.get_sentiment(review)
-            classification = self.classify_sentiment(review)
-            aspects = self.extract_aspects(review)
-
-            results.append({
-                'text': review,
-                'sentiment': sentiment,
-                'classification': classification,
-                'aspects': aspects
-            })
+        results = [self.analyze_review_cached(review, cache) for review in reviews]
 
         # Aggregate results
-        sentiment_counts = Counter([r['classification'] for r in results])
-        avg_compound = np.mean([r['sentiment']['compound'] for r in results])
-        avg_positive = np.mean([r['sentiment']['pos'] for r in results])
-        avg_negative = np.mean([r['sentiment']['neg'] for r in results])
-        avg_neutral = np.mean([r['sentiment']['neu'] for r in results])
+        aggregate = SentimentAggregate()
+        for result in results:
+            aggregate.add(result)
+
+        summary = aggregate.summary(include_scores=True)
+        summary['individual_results'] = results
+        return summary
+
+    def analyze_review_cached(self, review, cache=None):
+        """Analyze a single review, reusing and filling the cache when given"""
+        result = cache.get(review) if cache is not None else None
+        if result is None:
+            result = self.analyze_review(review)
+            if cache is not None:
+                cache.put(review, result)
+                _CACHE_LOOKUPS.inc(labels=('miss',))
+        else:
+            _CACHE_LOOKUPS.inc(labels=('hit',))
+        return result
 
-        # Get all aspects and count frequencies
-        all_aspects = [aspect for r in results for aspect in r['aspects']]
-        aspect_counts = Counter(all_aspects)
-        top_aspects = aspect_counts.most_common(10)
+class SentimentAggregate:
+    """Running sentiment statistics over a growing set of reviews, updated in O(1) per review"""
 
-        return {
-            'reviews_count': len(reviews),
-            'sentiment_counts': dict(sentiment_counts),
-            'avg_compound': avg_compound,
-            'avg_positive': avg_positive,
-            'avg_negative': avg_negative,
-            'avg_neutral': avg_neutral,
-            'top_aspects': top_aspects,
-            'individual_results': results
+    def __init__(self):
+        """Initialize an empty aggregate"""
+        self.reviews_count = 0
+        self.sentiment_counts = Counter()
+        self.score_sums = {'compound': 0.0, 'pos': 0.0, 'neg': 0.0, 'neu': 0.0}
+        self.aspect_counts = Counter()
+        self.compound_scores = []
+        self.lock = threading.Lock()
+
+    def add(self, result):
+        """
+        Add one analyzed review
+
+        Parameters:
+        -----------
+        result : dict
+            Result of SentimentAnalyzer.analyze_review
+        """
+        self.reviews_count += 1
+        self.sentiment_counts[result['classification']] += 1
+        for score in self.score_sums:
+            self.score_sums[score] += result['sentiment'][score]
+        self.aspect_counts.update(result['aspects'])
+        self.compound_scores.append(result['sentiment']['compound'])
+
+    def summary(self, include_scores=False):
+        """
+        Return the aggregated results
+
+        Parameters:
+        -----------
+        include_scores : bool
+            Whether to include the compound score of every review (the only
+            part of the summary whose size grows with the number of reviews)
+
+        Returns:
+        --------
+        dict
+            Review count, classification counts, average scores and top aspects
+        """
+        count = max(self.reviews_count, 1)
+        summary = {
+            'reviews_count': self.reviews_count,
+            'sentiment_counts': dict(self.sentiment_counts),
+            'avg_compound': self.score_sums['compound'] / count,
+            'avg_positive': self.score_sums['pos'] / count,
+            'avg_negative': self.score_sums['neg'] / count,
+            'avg_neutral': self.score_sums['neu'] / count,
+            'top_aspects': self.aspect_counts.most_common(10)
         }
+        if include_scores:
+            summary['compound_scores'] = list(self.compound_scores)
+        return summary
+
+# Process-wide analyzer shared by all requests (see get_analyzer)
+_analyzer = None
+_analyzer_lock = threading.Lock()
+
+def get_analyzer():
+    """
+    Return the process-wide SentimentAnalyzer, creating it on first use
+
+    Loading the VADER lexicon, stopwords and WordNet is a large fixed cost,
+    so it is paid once per process instead of once per request. Call this
+    at startup to warm the analyzer before serving.
+
+    Returns:
+    --------
+    SentimentAnalyzer
+        The shared, warmed-up analyzer
+    """
+    global _analyzer
+    if _analyzer is None:
+        with _analyzer_lock:
+            if _analyzer is None:
+                _analyzer = SentimentAnalyzer().warm_up()
+    return _analyzer
+
+def _score_chunk(reviews):
+    """Analyze a chunk of reviews in a worker process"""
+    return [get_analyzer().analyze_review(review) for review in reviews]
+
+class ReviewSentimentCache:
+    """Bounded LRU cache of per-review analysis results keyed by a hash of the review text"""
+
+    def __init__(self, max_size=100000, path=None):
+        """
+        Initialize the cache
+
+        Parameters:
+        -----------
+        max_size : int
+            Maximum number of reviews kept; the least recently used are evicted
+        path : str, optional
+            JSON file the cache is loaded from (if it exists) and saved to
+        """
+        self.max_size = max_size
+        self.path = path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Whether entries were added since the cache was loaded or saved
+        self._dirty = False
+
+        if path and os.path.exists(path):
+            # The cache only saves work: start empty rather than fail on a
+            # corrupt or unreadable file
+            try:
+                self._entries = self._read(path)
+            except (OSError, ValueError, TypeError, AttributeError) as e:
+                print(f"Ignoring unreadable review sentiment cache {path}: {e}")
+
+            # The file may hold more than max_size entries (e.g. written by
+            # backfill_sentiment.py); keep the most recently used ones
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _read(path):
+        """Return the entries of a saved cache file, least recently used first"""
+        with open(path) as f:
+            return OrderedDict(json.load(f))
+
+    @staticmethod
+    def key(text):
+        """Return the cache key of a review text"""
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def get(self, text):
+        """Return the cached result for a review text, or None"""
+        key = self.key(text)
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+            return result
+
+    def put(self, text, result):
+        """Cache the result for a review text, evicting the least recently used entries"""
+        with self._lock:
+            self._entries[self.key(text)] = result
+            self._entries.move_to_end(self.key(text))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    def save(self):
+        """
+        Merge the cache into its path atomically
+
+        A no-op without a path or when nothing was added since the last load
+        or save. The entries are merged into the file's rather than
+        replacing them, so a process with a smaller cache never truncates a
+        larger one (e.g. a backfill) on disk.
+        """
+        if not self.path:
+            return
+
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = OrderedDict(self._entries)
+            self._dirty = False
+
+        try:
+            merged = self._read(self.path)
+        except FileNotFoundError:
+            merged = OrderedDict()
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            print(f"Replacing unreadable review sentiment cache {self.path}: {e}")
+            merged = OrderedDict()
+        for key, result in entries.items():
+            merged[key] = result
+            merged.move_to_end(key)
+
+        # A temporary file of its own per call: every worker process saves
+        # the same cache at exit, and their writes must not interleave
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)),
+                                        prefix=os.path.basename(self.path) + '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(merged, f)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.remove(tmp_path)
+            with self._lock:
+                self._dirty = True
+            raise
+
+    def __len__(self):
+        return len(self._entries)
+
+# Per-review results shared by every request, persisted to
+# SENTIMENT_CACHE_PATH (filled ahead of time by backfill_sentiment.py; set
+# it to an empty string to keep the cache in memory only). At most
+# SENTIMENT_CACHE_SIZE entries of the file are kept in memory; new entries
+# are merged into it at exit
+REVIEW_CACHE_PATH = os.environ.get('SENTIMENT_CACHE_PATH', 'data/sentiment_cache.json') or None
+review_cache = ReviewSentimentCache(
+    max_size=int(os.environ.get('SENTIMENT_CACHE_SIZE', 100000)),
+    path=REVIEW_CACHE_PATH
+)
+
+# Corpus-level aspect counts written by aspect_mining.py. When present, top
+# aspects are read from it instead of the per-item aggregates.
+_aspect_index_path = os.environ.get('ASPECT_INDEX_PATH', 'data/aspect_index.json')
+aspect_index = AspectIndex.load(_aspect_index_path) if os.path.exists(_aspect_index_path) else None
+
+# Running sentiment aggregates per item, built on the first request for an
+# item and then kept up to date as its reviews arrive
+_item_aggregates = {}
+_item_aggregates_lock = threading.Lock()
+
+def _catch_up(aggregate, item_id):
+    """Add the item's reviews the aggregate has not seen yet (call with aggregate.lock held)"""
+    # An item's ratings are append-only, so the unseen ones are at the end
+    item_ratings = store.get_item_ratings(item_id)
+    if aggregate.reviews_count < len(item_ratings):
+        analyzer = get_analyzer()
+        for rating in item_ratings[aggregate.reviews_count:]:
+            aggregate.add(analyzer.analyze_review_cached(rating['review'], review_cache))
+
+def update_item_sentiment(item_id):
+    """
+    Fold an item's newly stored reviews into its aggregate
+
+    Call after a rating for the item is stored. Items nobody has requested
+    yet have no aggregate and are left to be built on first request.
 
-def analyze_item_reviews(item_id):
+    Parameters:
+    -----------
+    item_id : int
+        The ID of the item
+    """
+    if aspect_index is not None:
+        aspect_index.update(store.ratings, store.items_by_id, get_analyzer())
+
+    aggregate = _item_aggregates.get(item_id)
+    if aggregate is not None:
+        with aggregate.lock:
+            _catch_up(aggregate, item_id)
+
+@metrics.timed(_STAGE_SECONDS, ('item_analysis',))
+def analyze_item_reviews(item_id, include_scores=False):
     """
     Analyze reviews for a specific item
 
@@ -190,31 +581,38 @@ def analyze_item_reviews(item_id):
     -----------
     item_id : int
         The ID of the item
+    include_scores : bool
+        Whether to include the compound score of every review
 
     Returns:
     --------
     dict
         Sentiment analysis results for the item
     """
-    # Filter reviews for the specified item
-    item_reviews = [r['review'] for r in ratings if r['itemId'] == item_id]
-
-    if not item_reviews:
+    if not store.get_item_ratings(item_id):
         return {'error': f'No reviews found for item with ID {item_id}'}
 
     # Get item info
-    item_info = None
-    for item in items:
-        if item['id'] == item_id:
-            item_info = item
-            break
+    item_info = store.get_item(item_id)
 
     if not item_info:
         return {'error': f'Item with ID {item_id} not found'}
 
-    # Analyze reviews
-    analyzer = SentimentAnalyzer()
-    results = analyzer.analyze_reviews(item_reviews)
+    with _item_aggregates_lock:
+        aggregate = _item_aggregates.setdefault(item_id, SentimentAggregate())
+
+    # Read the running aggregate, scoring only reviews it has not seen yet
+    with aggregate.lock:
+        _catch_up(aggregate, item_id)
+        results = aggregate.summary(include_scores)
+
+    # Prefer the corpus-level aspect index, mining any ratings it has not seen
+    if aspect_index is not None:
+        aspect_index.update(store.ratings, store.items_by_id, get_analyzer())
+        top_aspects = aspect_index.top_aspects(item_id)
+        if top_aspects is not None:
+            results['top_aspects'] = top_aspects
+            results['category_top_aspects'] = aspect_index.top_category_aspects(item_info['category'])
 
     # Add item info to results
     results['item'] = {
@@ -241,60 +639,20 @@ def visualize_sentiment(analysis_results, save_path=None):
     --------
     None
     """
-    plt.figure(figsize=(15, 10))
-
-    # Plot 1: Sentiment Distribution
-    plt.subplot(2, 2, 1)
-    sentiment_counts = analysis_results['sentiment_counts']
-    labels = sentiment_counts.keys()
-    sizes = sentiment_counts.values()
-    plt.pie(sizes, labels=labels, autopct='%1.1f%%', startangle=90, colors=['green', 'red', 'gray'])
-    plt.title(f"Sentiment Distribution for {analysis_results['item']['name']}")
-
-    # Plot 2: Average Sentiment Scores
-    plt.subplot(2, 2, 2)
-    scores = [
-        analysis_results['avg_positive'],
-        analysis_results['avg_negative'],
-        analysis_results['avg_neutral']
-    ]
-    categories = ['Positive', 'Negative', 'Neutral']
-    colors = ['green', 'red', 'blue']
-    plt.bar(categories, scores, color=colors)
-    plt.title('Average Sentiment Scores')
-    plt.ylim(0, 1)
-
-    # Plot 3: Top Aspects
-    plt.subplot(2, 2, 3)
-    if analysis_results['top_aspects']:
-        aspects, counts = zip(*analysis_results['top_aspects'][:5])  # Get top 5 aspects
-        plt.bar(aspects, counts)
-        plt.title('Top 5 Aspects Mentioned in Reviews')
-        plt.xticks(rotation=45, ha='right')
-    else:
-        plt.text(0.5, 0.5, 'No aspects extracted', ha='center', va='center')
-        plt.title('Aspects Mentioned in Reviews')
-
-    # Plot 4: Compound Score Distribution
-    plt.subplot(2, 2, 4)
-    compound_scores = [r['sentiment']['compound'] for r in analysis_results['individual_results']]
-    sns.histplot(compound_scores, kde=True)
-    plt.title('Distribution of Compound Sentiment Scores')
-    plt.axvline(x=0, color='r', linestyle='--')
-
-    plt.tight_layout()
-
     if save_path:
-        plt.savefig(save_path)
-        plt.close()
+        with open(save_path, 'wb') as f:
+            f.write(render_sentiment_chart(analysis_results))
     else:
+        import matplotlib.pyplot as plt
+
+        draw_sentiment_chart(plt.figure(figsize=(15, 10)), analysis_results)
         plt.show()
 
 if __name__ == "__main__":
     # Analyze reviews for a few items
     for item_id in [1, 2, 6]:
         print(f"Analyzing item {item_id}...")
-        results = analyze_item_reviews(item_id)
+        results = analyze_item_reviews(item_id, include_scores=True)
 
         if 'error' in results:
             print(results['error'])
@@ -0,0 +1,186 @@
+"""
+Rendering and caching of sentiment analysis charts.
+
+Charts are drawn with matplotlib's object-oriented Figure API (no global
+pyplot state) in a pool of worker processes, and the PNG bytes are cached
+per (item, aggregate version) so each chart is rendered once per change.
+"""
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+import metrics
+
+# Instrumentation (see metrics.py)
+_CHART_REQUESTS = metrics.counter('sentiment_chart_cache_total',
+                                  "Chart requests by result: cached, rendered, or joined an in-flight render",
+                                  ['result'])
+_RENDER_SECONDS = metrics.histogram('sentiment_chart_render_seconds',
+                                    "Time chart requests waited for a render to finish")
+
+def draw_sentiment_chart(fig, results):
+    """
+    Draw the four sentiment analysis plots onto a figure
+
+    Parameters:
+    -----------
+    fig : matplotlib.figure.Figure
+        The figure to draw on
+    results : dict
+        Results from analyze_item_reviews(..., include_scores=True)
+    """
+    import seaborn as sns
+
+    axes = fig.subplots(2, 2)
+
+    # Plot 1: Sentiment Distribution
+    ax = axes[0, 0]
+    sentiment_counts = results['sentiment_counts']
+    labels = sentiment_counts.keys()
+    sizes = sentiment_counts.values()
+    ax.pie(sizes, labels=labels, autopct='%1.1f%%', startangle=90, colors=['green', 'red', 'gray'])
+    ax.set_title(f"Sentiment Distribution for {results['item']['name']}")
+
+    # Plot 2: Average Sentiment Scores
+    ax = axes[0, 1]
+    scores = [
+        results['avg_positive'],
+        results['avg_negative'],
+        results['avg_neutral']
+    ]
+    categories = ['Positive', 'Negative', 'Neutral']
+    colors = ['green', 'red', 'blue']
+    ax.bar(categories, scores, color=colors)
+    ax.set_title('Average Sentiment Scores')
+    ax.set_ylim(0, 1)
+
+    # Plot 3: Top Aspects
+    ax = axes[1, 0]
+    if results['top_aspects']:
+        aspects, counts = zip(*results['top_aspects'][:5])  # Get top 5 aspects
+        ax.bar(aspects, counts)
+        ax.set_title('Top 5 Aspects Mentioned in Reviews')
+        ax.tick_params(axis='x', labelrotation=45)
+        for label in ax.get_xticklabels():
+            label.set_horizontalalignment('right')
+    else:
+        ax.text(0.5, 0.5, 'No aspects extracted', ha='center', va='center')
+        ax.set_title('Aspects Mentioned in Reviews')
+
+    # Plot 4: Compound Score Distribution
+    ax = axes[1, 1]
+    sns.histplot(results['compound_scores'], kde=True, ax=ax)
+    ax.set_title('Distribution of Compound Sentiment Scores')
+    ax.axvline(x=0, color='r', linestyle='--')
+
+    fig.tight_layout()
+
+def render_sentiment_chart(results):
+    """
+    Render the sentiment analysis chart to PNG
+
+    Parameters:
+    -----------
+    results : dict
+        Results from analyze_item_reviews(..., include_scores=True)
+
+    Returns:
+    --------
+    bytes
+        The PNG image
+    """
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(15, 10))
+    draw_sentiment_chart(fig, results)
+
+    buf = BytesIO()
+    fig.savefig(buf, format='png')
+    return buf.getvalue()
+
+class ChartCache:
+    """Bounded LRU cache of rendered charts, rendering misses in a process pool"""
+
+    def __init__(self, max_size=256, max_workers=2):
+        """
+        Initialize the chart cache
+
+        Parameters:
+        -----------
+        max_size : int
+            Maximum number of cached PNG images
+        max_workers : int
+            Number of rendering worker processes (started on first miss)
+        """
+        self.max_size = max_size
+        self.max_workers = max_workers
+        self._images = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def get(self, key, results):
+        """
+        Return the PNG for a key, rendering it from results on a miss
+
+        Concurrent requests for the same missing key share one render.
+
+        Parameters:
+        -----------
+        key : hashable
+            Content key of the chart, e.g. (item_id, aggregate version)
+        results : dict
+            Chart input (see render_sentiment_chart), rendered on a miss
+
+        Returns:
+        --------
+        bytes
+            The PNG image
+        """
+        with self._lock:
+            png = self._images.get(key)
+            if png is not None:
+                self._images.move_to_end(key)
+                _CHART_REQUESTS.inc(labels=('hit',))
+                return png
+
+            future = self._pending.get(key)
+            if future is None:
+                if self._executor is None:
+                    # Forking a multi-threaded server process (with this lock
+                    # held) can deadlock the child; start renderers fresh
+                    if 'forkserver' in multiprocessing.get_all_start_methods():
+                        context = multiprocessing.get_context('forkserver')
+                        # The fork server preloads __main__ by default, which
+                        # would start a second copy of the app in it
+                        context.set_forkserver_preload(['sentiment_charts'])
+                    else:
+                        context = multiprocessing.get_context('spawn')
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+                future = self._executor.submit(render_sentiment_chart, results)
+                self._pending[key] = future
+                _CHART_REQUESTS.inc(labels=('miss',))
+            else:
+                _CHART_REQUESTS.inc(labels=('shared',))
+
+        try:
+            with _RENDER_SECONDS.time():
+                png = future.result()
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+        with self._lock:
+            self._images[key] = png
+            self._images.move_to_end(key)
+            while len(self._images) > self.max_size:
+                self._images.popitem(last=False)
+
+        return png
+
+chart_cache = ChartCache(
+    max_size=int(os.environ.get('CHART_CACHE_SIZE', 256)),
+    max_workers=int(os.environ.get('CHART_WORKERS', 2))
+)
@@ -0,0 +1,179 @@
+"""
+Synthetic dataset generator for benchmarking at scale.
+
+Generates users, items and ratings in the same record format as data.py.
+User activity and item popularity both follow power laws, so a few users
+rate many items and a few items collect most ratings, as in real rating
+data. Ratings come from a small latent factor model plus noise, and most
+carry a short review whose tone matches the rating (the others an empty
+one).
+
+Usage: python synthetic_data.py [--users 1000] [--items 500] [--density 0.02] [--output DIR]
+"""
+import argparse
+import json
+import os
+import time
+import numpy as np
+
+CATEGORIES = ['electronics', 'books', 'outdoor', 'sports', 'cooking', 'movies',
+              'photography', 'gaming', 'travel', 'health', 'art']
+
+# Aspect nouns mentioned in reviews of each category
+ASPECTS = {
+    'electronics': ['battery', 'screen', 'sound', 'camera', 'design'],
+    'books': ['story', 'characters', 'writing', 'ending', 'plot'],
+    'outdoor': ['material', 'size', 'grip', 'weight', 'durability'],
+    'sports': ['grip', 'material', 'size', 'comfort', 'durability'],
+    'cooking': ['recipes', 'instructions', 'photos', 'ingredients', 'layout'],
+    'movies': ['plot', 'acting', 'effects', 'soundtrack', 'ending'],
+    'photography': ['lens', 'image', 'autofocus', 'battery', 'weight'],
+    'gaming': ['controls', 'graphics', 'story', 'multiplayer', 'performance'],
+    'travel': ['size', 'wheels', 'zippers', 'weight', 'compartments'],
+    'health': ['accuracy', 'battery', 'app', 'comfort', 'tracking'],
+    'art': ['colors', 'quality', 'brushes', 'texture', 'packaging'],
+}
+
+POSITIVE = ["The {aspect} is excellent.", "Great {aspect}, I love it!", "Really impressed with the {aspect}.",
+            "The {aspect} exceeded my expectations."]
+NEUTRAL = ["The {aspect} is okay.", "Average {aspect}, nothing special.", "The {aspect} does the job."]
+NEGATIVE = ["The {aspect} is disappointing.", "Poor {aspect}, would not recommend.",
+            "I hate the {aspect}.", "The {aspect} broke after a week."]
+
+def _power_law_weights(n, alpha, rng):
+    """Return n shuffled weights proportional to rank^-alpha, summing to 1"""
+    weights = np.arange(1, n + 1, dtype=np.float64) ** -alpha
+    rng.shuffle(weights)
+    return weights / weights.sum()
+
+def _review(rating, aspects, draws):
+    """Write a two-sentence review whose tone follows the rating from four random integers"""
+    templates = POSITIVE if rating >= 4 else NEGATIVE if rating <= 2 else NEUTRAL
+    first = draws[0] % len(aspects)
+    second = (first + 1 + draws[1] % (len(aspects) - 1)) % len(aspects)
+    return " ".join([
+        templates[draws[2] % len(templates)].format(aspect=aspects[first]),
+        templates[draws[3] % len(templates)].format(aspect=aspects[second])
+    ])
+
+def generate_dataset(n_users=1000, n_items=500, density=0.02, user_alpha=1.0, item_alpha=1.0,
+                     review_fraction=0.9, n_factors=8, max_rounds=20, seed=0):
+    """
+    Generate a synthetic dataset
+
+    Parameters:
+    -----------
+    n_users : int
+        Number of users
+    n_items : int
+        Number of items
+    density : float
+        Target fraction of the user-item matrix that is rated. The result
+        can be slightly sparser when the most active users would have to
+        rate nearly every item.
+    user_alpha : float
+        Power-law exponent of user activity (0 for uniform)
+    item_alpha : float
+        Power-law exponent of item popularity (0 for uniform)
+    review_fraction : float
+        Fraction of ratings that carry a non-empty review
+    n_factors : int
+        Dimension of the latent factor model the ratings are drawn from
+    max_rounds : int
+        Maximum number of rounds redrawing duplicate (user, item) pairs
+    seed : int
+        Random seed
+
+    Returns:
+    --------
+    tuple
+        (users, items, ratings) lists in the record format of data.py,
+        ratings ordered by timestamp
+    """
+    rng = np.random.default_rng(seed)
+
+    user_categories = rng.integers(len(CATEGORIES), size=(n_users, 3))
+    users = [{
+        'id': user_id,
+        'name': f"User {user_id}",
+        'preferences': list(dict.fromkeys(CATEGORIES[c] for c in user_categories[user_id - 1]))
+    } for user_id in range(1, n_users + 1)]
+
+    item_categories = rng.integers(len(CATEGORIES), size=n_items)
+    items = [{
+        'id': item_id,
+        'name': f"{CATEGORIES[item_categories[item_id - 1]].title()} Item {item_id}",
+        'category': CATEGORIES[item_categories[item_id - 1]],
+        'description': f"Synthetic {CATEGORIES[item_categories[item_id - 1]]} item",
+        'tags': [CATEGORIES[item_categories[item_id - 1]]],
+        'imageUrl': f"https://placehold.co/400x300?text=Item+{item_id}"
+    } for item_id in range(1, n_items + 1)]
+
+    # Ratings per user follow the activity power law and the rated items are
+    # drawn by popularity. Repeated (user, item) draws are merged and the
+    # missing ratings redrawn, for a bounded number of rounds
+    target = density * n_users * n_items
+    activity = _power_law_weights(n_users, user_alpha, rng)
+    counts = np.clip(rng.poisson(activity * target), 1, n_items)
+    popularity = _power_law_weights(n_items, item_alpha, rng)
+
+    pairs = np.empty(0, dtype=np.int64)
+    missing = counts
+    for _ in range(max_rounds):
+        user_idx = np.repeat(np.arange(n_users, dtype=np.int64), missing)
+        item_idx = rng.choice(n_items, size=user_idx.shape[0], p=popularity)
+        pairs = np.sort(np.concatenate([pairs, user_idx * n_items + item_idx]))
+        pairs = pairs[np.concatenate([[True], pairs[1:] != pairs[:-1]])]
+        missing = counts - np.bincount(pairs // n_items, minlength=n_users)
+        if not missing.any():
+            break
+    user_idx, item_idx = pairs // n_items, pairs % n_items
+
+    # Ratings from user/item biases and latent factors, plus noise
+    user_factors = rng.normal(size=(n_users, n_factors))
+    item_factors = rng.normal(size=(n_items, n_factors))
+    affinity = np.einsum('ij,ij->i', user_factors[user_idx], item_factors[item_idx]) / np.sqrt(n_factors)
+    scores = (3.5 + rng.normal(0, 0.5, n_users)[user_idx] + rng.normal(0, 0.5, n_items)[item_idx]
+              + affinity + rng.normal(0, 0.5, pairs.shape[0]))
+    values = np.clip(np.rint(scores), 1, 5).astype(int)
+
+    # Spread timestamps over the past year and store ratings in arrival order
+    now = time.time()
+    timestamps = now - rng.uniform(0, 365 * 24 * 3600, pairs.shape[0])
+    has_review = rng.random(pairs.shape[0]) < review_fraction
+    review_draws = rng.integers(0, 2 ** 31, size=(pairs.shape[0], 4)).tolist()
+
+    ratings = []
+    for i in np.argsort(timestamps):
+        ratings.append({
+            'userId': int(user_idx[i]) + 1,
+            'itemId': int(item_idx[i]) + 1,
+            'rating': int(values[i]),
+            # Ratings without a review carry an empty one, as in data.py
+            'review': _review(values[i], ASPECTS[items[item_idx[i]]['category']], review_draws[i])
+                      if has_review[i] else "",
+            'timestamp': float(timestamps[i])
+        })
+
+    return users, items, ratings
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=1000, help="Number of users")
+    parser.add_argument('--items', type=int, default=500, help="Number of items")
+    parser.add_argument('--density', type=float, default=0.02, help="Target fraction of rated user-item pairs")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed")
+    parser.add_argument('--output', help="Directory to write users.json, items.json and ratings.json to")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    users, items, ratings = generate_dataset(args.users, args.items, args.density, seed=args.seed)
+    elapsed = time.perf_counter() - start
+    print(f"Generated {len(users)} users, {len(items)} items and {len(ratings)} ratings "
+          f"(density {len(ratings) / (len(users) * len(items)):.4f}) in {elapsed:.2f}s")
+
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+        for name, records in [('users', users), ('items', items), ('ratings', ratings)]:
+            with open(os.path.join(args.output, f"{name}.json"), 'w') as f:
+                json.dump(records, f)
@@ -0,0 +1,91 @@
+import copy
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+from collaborative_filtering import CollaborativeFilteringRecommender
+from model_store import ModelStore
+
+RATINGS = [
+    {'userId': 1, 'itemId': 10, 'rating': 5},
+    {'userId': 1, 'itemId': 11, 'rating': 3},
+    {'userId': 2, 'itemId': 10, 'rating': 4},
+    {'userId': 2, 'itemId': 12, 'rating': 1},
+    {'userId': 3, 'itemId': 11, 'rating': 2},
+    {'userId': 3, 'itemId': 12, 'rating': 5},
+    {'userId': 4, 'itemId': 13, 'rating': 4},
+    {'userId': 4, 'itemId': 10, 'rating': 2},
+]
+
+def train(ratings):
+    """Fit a small model on rating records"""
+    user_ids = sorted({r['userId'] for r in ratings})
+    item_ids = sorted({r['itemId'] for r in ratings})
+    user_to_idx = {user_id: i for i, user_id in enumerate(user_ids)}
+    item_to_idx = {item_id: i for i, item_id in enumerate(item_ids)}
+    matrix = csr_matrix(([r['rating'] for r in ratings],
+                         ([user_to_idx[r['userId']] for r in ratings], [item_to_idx[r['itemId']] for r in ratings])),
+                        shape=(len(user_ids), len(item_ids)))
+
+    model = CollaborativeFilteringRecommender(n_factors=2)
+    model.user_to_idx = user_to_idx
+    model.item_to_idx = item_to_idx
+    model.idx_to_user = dict(enumerate(user_ids))
+    model.idx_to_item = dict(enumerate(item_ids))
+    model.fit(matrix)
+    model.n_ratings = len(ratings)
+    return model
+
+@pytest.fixture
+def store():
+    ratings = list(RATINGS)
+    return ModelStore(lambda: train(ratings), ratings, refit_threshold=10 ** 6).start(start_trainer=False)
+
+def test_snapshot_mappings_and_shapes_do_not_change(store):
+    old = store.current
+    old_model = old.model
+    n_users, n_items = old_model.user_factors.shape[0], old_model.item_factors.shape[0]
+
+    for i in range(40):
+        store.add_rating({'userId': 100 + i, 'itemId': 200 + i % 3, 'rating': 4})
+
+    assert store.current.updates == old.updates + 40
+    assert old_model.user_factors.shape[0] == n_users
+    assert old_model.user_factors_normalized.shape[0] == n_users
+    assert old_model.item_factors.shape[0] == n_items
+    assert len(old_model.user_to_idx) == n_users and 100 not in old_model.user_to_idx
+    assert len(old_model.idx_to_item) == n_items and 200 not in old_model.item_to_idx
+    assert sorted(old_model.idx_to_user) == list(range(n_users))
+    assert not old_model.rating_updates
+
+    model = store.current.model
+    assert model.user_factors.shape[0] == n_users + 40
+    assert model.idx_to_user[model.user_to_idx[139]] == 139
+    assert model.item_factors.shape[0] == n_items + 3
+    assert model.recommend_items(model.user_to_idx[139], 2)
+
+def test_snapshot_sees_refreshed_rows_of_existing_users(store):
+    # Snapshots share the factor arrays: folding in a rating of an existing
+    # user refreshes its row for older snapshots too (see ModelSnapshot)
+    old_model = store.current.model
+    user_idx = old_model.user_to_idx[1]
+    before = old_model.user_factors[user_idx].copy()
+
+    store.add_rating({'userId': 1, 'itemId': 12, 'rating': 1})
+
+    model = store.current.model
+    assert not np.allclose(model.user_factors[user_idx], before)
+    np.testing.assert_array_equal(old_model.user_factors[user_idx], model.user_factors[user_idx])
+    assert user_idx not in old_model.rating_updates
+
+def test_branching_from_an_older_snapshot_does_not_affect_newer_ones(store):
+    old_model = store.current.model
+    store.add_rating({'userId': 100, 'itemId': 10, 'rating': 5})
+    newer = store.current.model
+
+    branch = copy.copy(old_model)
+    branch.partial_fit(999, 10, 1)
+
+    assert branch.user_to_idx[999] == newer.user_to_idx[100]
+    assert 999 not in newer.user_to_idx and 100 not in branch.user_to_idx
+    assert newer.idx_to_user[newer.user_to_idx[100]] == 100
+    assert not np.shares_memory(branch.user_factors, newer.user_factors)
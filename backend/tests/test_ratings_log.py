@@ -0,0 +1,113 @@
+import json
+import os
+import pytest
+from ratings_log import RatingsLog, RatingsLogTailer
+
+def rating(user_id, item_id=1, value=4):
+    return {'userId': user_id, 'itemId': item_id, 'rating': value, 'review': f"review {user_id}"}
+
+def write_lines(path, records, tail=b''):
+    with open(path, 'wb') as f:
+        for record in records:
+            f.write((json.dumps(record) + '\n').encode('utf-8'))
+        f.write(tail)
+
+@pytest.fixture
+def directory(tmp_path):
+    return str(tmp_path)
+
+def test_replay_drops_a_torn_last_line(directory):
+    log_path = os.path.join(directory, 'ratings.log.jsonl')
+    write_lines(log_path, [rating(1), rating(2)], tail=b'{"userId": 3, "itemId": 1, "ra')
+
+    log = RatingsLog(directory, default=[rating(0)], compact_every=0)
+    records, offset = log.replay()
+    assert records == [rating(0), rating(1), rating(2)]
+    assert offset == os.path.getsize(log_path)
+
+    # The torn bytes are truncated, so the next record starts on its own line
+    log.append(rating(4))
+    log.close()
+    log = RatingsLog(directory, default=[rating(0)], compact_every=0)
+    assert log.load() == [rating(0), rating(1), rating(2), rating(4)]
+    log.close()
+
+def test_replay_skips_invalid_records(directory):
+    log_path = os.path.join(directory, 'ratings.log.jsonl')
+    write_lines(log_path, [rating(1), {'userId': 'x', 'itemId': 1, 'rating': 4}, rating(2, value=9)],
+                tail=b'not json\n')
+
+    assert RatingsLog(directory, compact_every=0).load() == [rating(1)]
+
+def test_crash_between_rotate_and_snapshot(directory, monkeypatch):
+    log = RatingsLog(directory, default=[rating(0)], compact_every=0)
+    log.append(rating(1))
+    log.append(rating(2))
+
+    # The log is rotated, then the process dies before the snapshot is written
+    def crash():
+        raise OSError("crash")
+    monkeypatch.setattr(log, '_write_snapshot', crash)
+    with pytest.raises(OSError):
+        log.compact()
+    log.append(rating(3))
+    log.close()
+    assert os.path.exists(log.rotated_path)
+
+    # Reopening finishes the compaction; nothing is lost or replayed twice
+    log = RatingsLog(directory, default=[rating(0)], compact_every=0)
+    assert not os.path.exists(log.rotated_path)
+    with open(log.snapshot_path) as f:
+        assert json.load(f) == [rating(0), rating(1), rating(2)]
+    assert log.load() == [rating(0), rating(1), rating(2), rating(3)]
+
+def test_crash_after_snapshot_before_deleting_rotated_log(directory):
+    # The new snapshot already holds the rotated log's records
+    with open(os.path.join(directory, 'ratings.json'), 'w') as f:
+        json.dump([rating(0), rating(1), rating(2)], f)
+    write_lines(os.path.join(directory, 'ratings.log.jsonl.compacting'), [rating(1), rating(2)])
+    write_lines(os.path.join(directory, 'ratings.log.jsonl'), [rating(3)])
+
+    log = RatingsLog(directory, compact_every=0)
+    assert log.load() == [rating(0), rating(1), rating(2), rating(3)]
+    assert not os.path.exists(log.rotated_path)
+
+def test_tailer_applies_records_appended_after_replay(directory):
+    log = RatingsLog(directory, default=[rating(0)], compact_every=0)
+    log.append(rating(1))
+    records, offset = log.replay()
+    applied = []
+    tailer = RatingsLogTailer(log.log_path, offset, applied.append)
+
+    assert tailer.poll() == 0
+    log.append(rating(2))
+    log.append(rating(3))
+    assert tailer.poll() == 2
+    assert tailer.poll() == 0
+    assert records + applied == log.load()
+
+def test_tailer_picks_up_across_a_rotation(directory):
+    log = RatingsLog(directory, default=[rating(0)], compact_every=0)
+    records, offset = log.replay()
+    applied = []
+    tailer = RatingsLogTailer(log.log_path, offset, applied.append)
+
+    log.append(rating(1))
+    assert tailer.poll() == 1
+
+    # Records both before and after the rotation reach the tailer, even
+    # though the compaction deletes the rotated log before the next poll
+    log.append(rating(2))
+    log.compact()
+    log.append(rating(3))
+    assert not os.path.exists(log.rotated_path)
+    assert tailer.poll() == 2
+    assert applied == [rating(1), rating(2), rating(3)]
+
+    log.append(rating(4))
+    log.compact()
+    assert tailer.poll() == 1
+    log.append(rating(5))
+    assert tailer.poll() == 1
+    assert records + applied == log.load()
+    log.close()
@@ -0,0 +1,6 @@
+"""
+WSGI entry point for production servers.
+
+Usage: gunicorn -c gunicorn.conf.py wsgi:app
+"""
+from app import app